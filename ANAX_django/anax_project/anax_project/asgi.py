@@ -14,3 +14,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'anax_project.settings')
 
 application = get_asgi_application()
+
+# Product view counters are buffered in memory and written from a thread
+# that only serving processes run, each starting its own on its first view
+# (see products.popularity).
+from products import popularity  # noqa: E402
+
+popularity.enable_flusher()
@@ -67,8 +67,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'core.query_log.QueryCaptureMiddleware',
 ]
 
+# Set to a file path to record every distinct SELECT shape served, for
+# `manage.py index_advisor`. Off unless the environment asks for it.
+QUERY_CAPTURE_PATH = os.environ.get('QUERY_CAPTURE_PATH')
+
+# How often (seconds) buffered product view counts are written to
+# ProductStats; see products.popularity.
+PRODUCT_STATS_FLUSH_INTERVAL = 5
+
 ROOT_URLCONF = 'anax_project.urls'
 
 TEMPLATES = [
@@ -101,6 +110,17 @@ DATABASES = {
 }
 
 
+# Cache
+# Invalidation versions for the in-process product indexes live here, so in
+# production this must be a backend shared by every worker (Redis, Memcached).
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -145,6 +165,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads above 1 MB are spooled to a temporary file instead of being held in
+# memory, and are then moved (not copied) into MEDIA_ROOT on save.
+FILE_UPLOAD_MAX_MEMORY_SIZE = 1024 * 1024
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
@@ -153,6 +177,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
+    'DEFAULT_PAGINATION_CLASS': 'core.pagination.KeysetPagination',
 }
 
 SIMPLE_JWT = {
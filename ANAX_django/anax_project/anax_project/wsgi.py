@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'anax_project.settings')
 
 application = get_wsgi_application()
+
+# Product view counters are buffered in memory and written from a thread
+# that only serving processes run, each starting its own on its first view
+# (see products.popularity).
+from products import popularity  # noqa: E402
+
+popularity.enable_flusher()
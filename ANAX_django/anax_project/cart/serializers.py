@@ -1,27 +1,30 @@
 from rest_framework import serializers
 from .models import Cart, CartItem
-from products.serializers import ProductSerializer
+from core.fieldsets import ExpandableFieldsMixin, SparseFieldsetMixin
+from products.serializers import ProductSerializer, ProductSummarySerializer
 
 
-class CartItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class CartItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)  # ?expand=items.product for the full product
     product_id = serializers.IntegerField(write_only=True)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'total_price']
+        expandable_fields = {'product': ProductSerializer}
     
     def get_total_price(self, obj):
         return obj.total_price()
 
-class CartSerializer(serializers.ModelSerializer):
+class CartSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
         fields = ['id', 'items', 'total_price']
+        field_sources = {'total_price': ['items']}
 
     def get_total_price(self, obj):
         return obj.total_price()
@@ -2,15 +2,21 @@ from django.shortcuts import render
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.db.models import prefetch_related_objects
+from core.fieldsets import expansion_prefetches
 from .models import Cart, CartItem
 from .serializers import CartSerializer, CartItemSerializer
 
 class CartView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = CartSerializer
+    expand_prefetches = {
+        'items.product': ['items__product__images', 'items__product__tags', 'items__product__category'],
+    }
 
     def get_object(self):
         cart, created = Cart.objects.get_or_create(user=self.request.user)
+        prefetch_related_objects([cart], 'items__product', *expansion_prefetches(self.request, self))
         return cart
 
 class AddToCartView(generics.CreateAPIView):
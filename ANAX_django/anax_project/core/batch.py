@@ -0,0 +1,70 @@
+"""
+Set-based helpers shared by the precomputed tables (related products,
+bought together, best sellers) and the indexes kept beside the catalog:
+chunked IN lookups, rows replaced through executemany, and the queues of
+ids waiting to be recomputed.
+"""
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+# Keeps IN (...) lists under SQLite's bound-parameter limit.
+QUERY_CHUNK_SIZE = 900
+
+
+def chunked(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def insert_rows(model, columns, rows):
+    """
+    Insert `rows` (tuples in `columns` order) with one executemany rather
+    than building model instances.
+    """
+    quote = connection.ops.quote_name
+    names = ', '.join(quote(column) for column in columns)
+    placeholders = ', '.join(['%s'] * len(columns))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote(model._meta.db_table)} ({names}) VALUES ({placeholders})", rows,
+        )
+
+
+def replace_rows(model, key, values, columns, rows):
+    """
+    Delete the rows of `model` whose `key` is in `values` and insert `rows`
+    in their place, in one transaction.
+    """
+    with transaction.atomic():
+        for chunk in chunked(values):
+            model.objects.filter(**{f'{key}__in': chunk}).delete()
+        insert_rows(model, columns, rows)
+
+
+def enqueue(queue_model, ids):
+    """
+    Add ids to a queue table keyed on them; ids already queued stay as they
+    are.
+    """
+    queue_model.objects.bulk_create([queue_model(pk=pk) for pk in set(ids)], ignore_conflicts=True)
+
+
+@contextmanager
+def claim(queue_model):
+    """
+    Take every queued id off `queue_model` before the work on them starts
+    and yield them. An id queued again while the work runs is a new row, so
+    it stays queued for the next pass; if the work fails the claimed ids go
+    back on the queue.
+    """
+    with transaction.atomic():
+        ids = list(queue_model.objects.values_list('pk', flat=True))
+        for chunk in chunked(ids):
+            queue_model.objects.filter(pk__in=chunk).delete()
+    try:
+        yield ids
+    except BaseException:
+        enqueue(queue_model, ids)
+        raise
@@ -0,0 +1,219 @@
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+FIELDS_QUERY_PARAM = 'fields'
+EXPAND_QUERY_PARAM = 'expand'
+
+
+def requested_fields(request):
+    """
+    The names in `?fields=id,name,price`, or None when the client wants
+    everything.
+    """
+    if request is None:
+        return None
+    value = request.query_params.get(FIELDS_QUERY_PARAM, '')
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    return names or None
+
+
+def requested_expansions(request, view=None):
+    """
+    Dotted paths to expand, from `?expand=items.product.images` plus the
+    view's `default_expand`, with every prefix included: expanding
+    items.product.images implies expanding items.product.
+    """
+    paths = set(getattr(view, 'default_expand', ()))
+    if request is not None:
+        paths.update(path.strip() for path in request.query_params.get(EXPAND_QUERY_PARAM, '').split(','))
+    expansions = set()
+    for path in filter(None, paths):
+        parts = path.split('.')
+        expansions.update('.'.join(parts[:i]) for i in range(1, len(parts) + 1))
+    return expansions
+
+
+def serializer_path(serializer):
+    """
+    Where a nested serializer sits under the root, e.g. "items" for the
+    child of an order's `items` list.
+    """
+    parts = []
+    while serializer is not None:
+        if serializer.field_name:
+            parts.append(serializer.field_name)
+        serializer = serializer.parent
+    return '.'.join(reversed(parts))
+
+
+def is_root(serializer):
+    parent = serializer.parent
+    if isinstance(parent, ListSerializer):
+        parent = parent.parent
+    return parent is None
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin that drops every field not named in `?fields=` when it is
+    the serializer a read renders; nested uses keep all their fields, and so
+    do writes, which must not silently ignore what they were sent. Unknown
+    names are a 400.
+
+    Fields that read more than their own source (method fields, totals) list
+    what they need in `Meta.field_sources` so SparseQuerysetMixin can keep
+    those columns and prefetches.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if not is_root(self) or request is None or request.method not in SAFE_METHODS:
+            return fields
+        names = requested_fields(request)
+        if names is None:
+            return fields
+        unknown = names - fields.keys()
+        if unknown:
+            raise ValidationError({FIELDS_QUERY_PARAM: [f"Unknown field '{name}'." for name in sorted(unknown)]})
+        return {name: field for name, field in fields.items() if name in names}
+
+
+class ExpandableFieldsMixin:
+    """
+    Serializer mixin for relations that render as ids or a summary unless the
+    client asks for more. `Meta.expandable_fields` maps a field name to the
+    serializer class used when its path is expanded, or to a
+    `(class, kwargs)` pair, e.g. `{'images': (ProductImageSerializer, {'many': True})}`.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        if not expandable:
+            return fields
+        expansions = requested_expansions(self.context.get('request'), self.context.get('view'))
+        path = serializer_path(self)
+        for name, expanded in expandable.items():
+            if (f'{path}.{name}' if path else name) not in expansions:
+                continue
+            serializer_class, kwargs = expanded if isinstance(expanded, tuple) else (expanded, {})
+            fields[name] = serializer_class(read_only=True, **kwargs)
+        return fields
+
+
+def expansion_prefetches(request, view):
+    """
+    The view's `expand_prefetches` lookups for every requested expansion.
+    """
+    expansions = requested_expansions(request, view)
+    return [
+        lookup
+        for path, lookups in getattr(view, 'expand_prefetches', {}).items()
+        if path in expansions
+        for lookup in lookups
+    ]
+
+
+def _select_paths(select_related, prefix=''):
+    for name, nested in select_related.items():
+        path = prefix + name
+        if nested:
+            yield from _select_paths(nested, path + '__')
+        else:
+            yield path
+
+
+def _lookup_root(lookup):
+    path = lookup.prefetch_through if isinstance(lookup, Prefetch) else lookup
+    return path.split('__')[0]
+
+
+def narrow_queryset(queryset, serializer):
+    """
+    Load only the columns, joins and prefetches the serializer's (already
+    trimmed) fields read, plus the pk and ordering columns. Returns the
+    queryset unchanged if some field reads an attribute we can't map to the
+    model, since deferring would then cost a query per row.
+    """
+    opts = queryset.model._meta
+    sources = getattr(serializer.Meta, 'field_sources', {})
+    wanted = set()
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if name in sources:
+            wanted.update(sources[name])
+        elif field.source != '*':
+            wanted.add(field.source.split('.')[0])
+        else:
+            return queryset
+
+    columns = {opts.pk.name}
+    relations = set()
+    for name in wanted:
+        try:
+            model_field = opts.get_field(name)
+        except FieldDoesNotExist:
+            return queryset
+        if model_field.concrete and not model_field.many_to_many:
+            columns.add(model_field.name)
+        if model_field.is_relation:
+            relations.add(model_field.name)
+
+    # The paginator reads the ordering columns back off each row.
+    for ordering in queryset.query.order_by or opts.ordering:
+        if isinstance(ordering, str):
+            name = ordering.lstrip('-').split('__')[0]
+            if name == 'pk':
+                continue
+            try:
+                model_field = opts.get_field(name)
+            except FieldDoesNotExist:
+                continue
+            if model_field.concrete and not model_field.many_to_many:
+                columns.add(model_field.name)
+
+    select_related = queryset.query.select_related
+    prefetches = [
+        lookup for lookup in queryset._prefetch_related_lookups if _lookup_root(lookup) in relations
+    ]
+    queryset = queryset.prefetch_related(None).prefetch_related(*prefetches)
+    if isinstance(select_related, dict):
+        joins = [path for path in _select_paths(select_related) if path.split('__')[0] in relations]
+        queryset = queryset.select_related(None)
+        if joins:
+            queryset = queryset.select_related(*joins)
+    elif select_related:
+        return queryset
+    return queryset.only(*columns)
+
+
+class ExpandableQuerysetMixin:
+    """
+    View mixin that runs only the prefetches the requested expansions need,
+    as declared in `expand_prefetches = {'items.product': [lookups]}`.
+    """
+    default_expand = ()
+    expand_prefetches = {}
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        lookups = expansion_prefetches(self.request, self)
+        return queryset.prefetch_related(*lookups) if lookups else queryset
+
+
+class SparseQuerysetMixin:
+    """
+    View mixin that pushes `?fields=` down to the query, so columns (and
+    joins or prefetches) no requested field uses are never read.
+    """
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if requested_fields(self.request) is None:
+            return queryset
+        return narrow_queryset(queryset, self.get_serializer())
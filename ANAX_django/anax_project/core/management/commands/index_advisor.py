@@ -0,0 +1,88 @@
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections
+
+from core import query_log
+
+# "SCAN products_product" with no index after it reads the whole table;
+# "SCAN t USING INDEX i" walks an index in order and is left alone.
+FULL_SCAN = re.compile(r'^SCAN (\S+)(?: AS (\S+))?$')
+TABLE_ALIAS = re.compile(r'"(\w+)" (?:AS )?"?(U\d+|T\d+|V\d+)"?')
+
+
+def plan(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay captured query shapes (see core.query_log) under EXPLAIN QUERY PLAN "
+        "and report every full table scan, grouped by app."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=getattr(settings, 'QUERY_CAPTURE_PATH', None),
+            help="Captured queries (default: settings.QUERY_CAPTURE_PATH).",
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help="Ignore scans of tables smaller than this; they are cheaper than an index.",
+        )
+        parser.add_argument('--strict', action='store_true', help="Exit non-zero if anything is flagged.")
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError("No capture file given and QUERY_CAPTURE_PATH is not set.")
+        try:
+            queries = query_log.load(options['path'])
+        except FileNotFoundError:
+            raise CommandError(f"No captured queries at {options['path']}.")
+
+        app_labels = {model._meta.db_table: model._meta.app_label for model in apps.get_models(include_auto_created=True)}
+        row_counts = {}
+        findings = {}
+        skipped = 0
+        for query in queries:
+            connection = connections[query['alias']]
+            if connection.vendor != 'sqlite':
+                skipped += 1
+                continue
+            try:
+                details = plan(connection, query['sql'], query['params'])
+            except DatabaseError:
+                skipped += 1
+                continue
+            aliases = dict((alias, table) for table, alias in TABLE_ALIAS.findall(query['sql']))
+            for detail in details:
+                match = FULL_SCAN.match(detail)
+                if match is None:
+                    continue
+                table = aliases.get(match.group(2) or match.group(1), match.group(1))
+                if table not in app_labels:
+                    continue
+                if (query['alias'], table) not in row_counts:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+                        row_counts[query['alias'], table] = cursor.fetchone()[0]
+                rows = row_counts[query['alias'], table]
+                if rows >= options['min_rows']:
+                    findings.setdefault(app_labels[table], []).append((table, rows, query['shape']))
+
+        for app_label in sorted(findings):
+            self.stdout.write(self.style.MIGRATE_HEADING(app_label))
+            for table, rows, shape in findings[app_label]:
+                self.stdout.write(self.style.WARNING(f"  full scan of {table} ({rows} rows)"))
+                self.stdout.write(f"    {shape}")
+        flagged = sum(len(found) for found in findings.values())
+        summary = f"Checked {len(queries) - skipped} query shapes, {flagged} full scans"
+        if skipped:
+            summary += f", {skipped} skipped (not SQLite or no longer valid)"
+        self.stdout.write((self.style.WARNING if flagged else self.style.SUCCESS)(summary + '.'))
+        if flagged and options['strict']:
+            raise CommandError(f"{flagged} full table scans found.")
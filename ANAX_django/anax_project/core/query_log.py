@@ -0,0 +1,108 @@
+"""
+Captures the distinct SELECT shapes an app actually runs, with one sample of
+their parameters, so `manage.py index_advisor` can replay them under
+EXPLAIN QUERY PLAN.
+
+Set QUERY_CAPTURE_PATH to a file and every request through
+QueryCaptureMiddleware appends shapes it has not seen yet, one JSON object
+per line. `record(path)` does the same around any block of code, e.g. a
+test run or a management command.
+"""
+import json
+import re
+import threading
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def shape(sql):
+    """
+    The statement with IN lists of any length folded together, so a lookup
+    of 3 ids and one of 300 count as the same query.
+    """
+    return _IN_LIST.sub('IN (...)', _WHITESPACE.sub(' ', sql).strip())
+
+
+def _jsonable(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, bytes):
+        return None
+    return str(value)
+
+
+class QueryRecorder:
+    """
+    An execute_wrapper that appends each new SELECT shape to `path`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.seen = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            key = (context['connection'].alias, shape(sql))
+            if key not in self.seen:
+                self.write(key, sql, params)
+        return execute(sql, params, many, context)
+
+    def write(self, key, sql, params):
+        alias, query_shape = key
+        line = json.dumps({
+            'alias': alias,
+            'shape': query_shape,
+            'sql': sql,
+            'params': [_jsonable(value) for value in params or ()],
+        })
+        with self._lock:
+            if key in self.seen:
+                return
+            self.seen.add(key)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+
+@contextmanager
+def installed(recorder):
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        yield recorder
+
+
+def record(path):
+    return installed(QueryRecorder(path))
+
+
+def load(path):
+    """
+    Captured queries from `path`, one per shape.
+    """
+    queries = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                queries.setdefault((query['alias'], query['shape']), query)
+    return list(queries.values())
+
+
+class QueryCaptureMiddleware:
+    def __init__(self, get_response):
+        path = getattr(settings, 'QUERY_CAPTURE_PATH', None)
+        if not path:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.recorder = QueryRecorder(path)
+
+    def __call__(self, request):
+        with installed(self.recorder):
+            return self.get_response(request)
@@ -0,0 +1,54 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+
+class QueryBudgetTestCase(APITestCase):
+    """
+    Fails when a view runs more queries than the `query_budget` it declares.
+    """
+
+    def tearDown(self):
+        # Row ids are reused between tests, so cached payloads must not be.
+        cache.clear()
+        super().tearDown()
+
+    def assertWithinQueryBudget(self, view_class, url, method='get', **kwargs):
+        budget = getattr(view_class, 'query_budget', None)
+        if budget is None:
+            self.fail(f"{view_class.__name__} does not declare a query_budget")
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, **kwargs)
+
+        executed = len(ctx.captured_queries)
+        if executed > budget:
+            queries = "\n".join(
+                f"{i}. {q['sql']}" for i, q in enumerate(ctx.captured_queries, start=1)
+            )
+            self.fail(
+                f"{view_class.__name__} ran {executed} queries against a budget "
+                f"of {budget} for {method.upper()} {url}:\n{queries}"
+            )
+        return response
+
+
+class TemporaryMediaMixin:
+    """
+    Points MEDIA_ROOT at a fresh directory for the test class and removes it
+    afterwards, so uploads neither outlive the run nor meet another class's.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        media_root = tempfile.mkdtemp(prefix='anax-test-media-')
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        cls.addClassCleanup(media.disable)
+        super().setUpClass()
@@ -1,3 +1,42 @@
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
 from django.test import TestCase
 
-# Create your tests here.
+from products.models import Product
+from . import query_log
+from .models import AuditLog
+
+
+class IndexAdvisorTests(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+
+    def test_shapes_fold_in_lists(self):
+        self.assertEqual(
+            query_log.shape('SELECT * FROM t WHERE id IN (%s, %s,\n %s)'),
+            query_log.shape('SELECT * FROM t WHERE id IN (%s)'),
+        )
+
+    def test_flags_full_scans_by_app(self):
+        with query_log.record(self.path):
+            list(AuditLog.objects.filter(description='restock'))
+            list(Product.objects.filter(sku='A-1'))
+            list(Product.objects.filter(pk__in=[1, 2]))
+            list(Product.objects.filter(pk__in=[3, 4, 5]))
+        self.assertEqual(len(query_log.load(self.path)), 3)
+
+        out = StringIO()
+        call_command('index_advisor', self.path, min_rows=0, stdout=out)
+        self.assertIn('full scan of core_auditlog', out.getvalue())
+        self.assertNotIn('full scan of products_product', out.getvalue())
+        self.assertIn('1 full scans', out.getvalue())
+
+        with self.assertRaises(CommandError):
+            call_command('index_advisor', self.path, min_rows=0, strict=True, stdout=StringIO())
+        # Scans of tables under --min-rows are cheaper than any index.
+        call_command('index_advisor', self.path, strict=True, stdout=StringIO())
@@ -0,0 +1,178 @@
+"""
+Best sellers by units sold in paid orders over rolling 7/30/90-day windows.
+
+Each product's totals live on its ProductStats row (sold_7d, sold_30d,
+sold_90d, each indexed), which is what `?ordering=-best_selling` sorts the
+product list by; the TOP_N of every category per window are kept, ranked,
+in the BestSeller table.
+
+An order counts from the day it was placed, so a full rebuild and the
+incremental updates agree. Orders becoming paid (or cancelled) queue their
+products, and update_stale() recounts just those exactly and re-ranks their
+categories; a nightly rebuild() moves the windows along for everyone else.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from core.batch import chunked, claim, enqueue, insert_rows, replace_rows
+from products import cache, popularity
+
+WINDOWS = (7, 30, 90)
+DEFAULT_WINDOW = 30
+TOP_N = 50
+
+
+def column(window):
+    return f'sold_{window}d'
+
+
+def paid_items(since):
+    from .models import Order, OrderItem
+
+    return OrderItem.objects.filter(order__status__in=Order.PAID_STATUSES, order__created_at__gte=since)
+
+
+def units_sold(product_ids=None, now=None):
+    """
+    `{product_id: {column: units}}` for products sold in the longest window,
+    from one grouped query (per chunk of `product_ids`, when given).
+    """
+    now = now or timezone.now()
+    sums = {
+        column(window): Sum('quantity', filter=Q(order__created_at__gte=now - timedelta(days=window)))
+        for window in WINDOWS
+    }
+    items = paid_items(now - timedelta(days=max(WINDOWS)))
+    querysets = [items] if product_ids is None else (
+        items.filter(product_id__in=chunk) for chunk in chunked(product_ids)
+    )
+    totals = {}
+    for queryset in querysets:
+        for row in queryset.values('product_id').annotate(**sums).values('product_id', *sums):
+            totals[row.pop('product_id')] = {name: units or 0 for name, units in row.items()}
+    return totals
+
+
+def store_sold(totals, product_ids):
+    """
+    Write `totals` to the ProductStats rows of `product_ids`, zeroing those
+    with no sales left.
+    """
+    from products.models import ProductStats
+
+    names = [column(window) for window in WINDOWS]
+    zero = dict.fromkeys(names, 0)
+    quote = connection.ops.quote_name
+    assignments = ', '.join(f'{quote(name)} = %s' for name in names)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(ProductStats._meta.db_table)} SET {assignments} WHERE product_id = %s",
+            [[*(totals.get(pk, zero)[name] for name in names), pk] for pk in product_ids],
+        )
+
+
+def rank_categories(category_ids=None):
+    """
+    Re-rank the given categories (all of them when None) in every window,
+    from one query per window on the sold_* index.
+    """
+    from products.models import ProductStats
+
+    from .models import BestSeller
+
+    rows = []
+    for window in WINDOWS:
+        name = column(window)
+        sellers = ProductStats.objects.filter(
+            **{f'{name}__gt': 0}, product__is_active=True, product__category__isnull=False,
+        )
+        chunks = [None] if category_ids is None else chunked(category_ids)
+        by_category = defaultdict(list)
+        for chunk in chunks:
+            queryset = sellers if chunk is None else sellers.filter(product__category_id__in=chunk)
+            for category_id, product_id, units in queryset.values_list('product__category_id', 'product_id', name):
+                by_category[category_id].append((-units, product_id))
+        for category_id, ranked in by_category.items():
+            ranked.sort()
+            rows.extend(
+                (category_id, window, position, product_id, -units)
+                for position, (units, product_id) in enumerate(ranked[:TOP_N])
+            )
+
+    columns = ('category_id', 'window', 'rank', 'product_id', 'quantity')
+    if category_ids is None:
+        with transaction.atomic():
+            BestSeller.objects.all().delete()
+            insert_rows(BestSeller, columns, rows)
+    else:
+        replace_rows(BestSeller, 'category_id', category_ids, columns, rows)
+    return len(rows)
+
+
+def rebuild(now=None):
+    """
+    Recount every product and re-rank every category, clearing whatever was
+    queued before it started. Returns how many products have sales.
+    """
+    from products.models import ProductStats
+
+    from .models import BestSellerQueue
+
+    with claim(BestSellerQueue):
+        totals = units_sold(now=now)
+        with transaction.atomic():
+            ProductStats.objects.filter(
+                Q(sold_7d__gt=0) | Q(sold_30d__gt=0) | Q(sold_90d__gt=0)
+            ).update(**{column(window): 0 for window in WINDOWS})
+            store_sold(totals, list(totals))
+            rank_categories()
+    transaction.on_commit(lambda: cache.bump_version(popularity.VERSION_NAME))
+    return len(totals)
+
+
+def update(product_ids, now=None):
+    """
+    Recount the given products exactly and re-rank the categories they are
+    in now or were ranked in before.
+    """
+    from products.models import Product
+
+    from .models import BestSeller
+
+    product_ids = list(product_ids)
+    totals = units_sold(product_ids, now)
+    category_ids = set()
+    for chunk in chunked(product_ids):
+        category_ids.update(
+            Product.objects.filter(pk__in=chunk, category__isnull=False).values_list('category_id', flat=True)
+        )
+        category_ids.update(BestSeller.objects.filter(product_id__in=chunk).values_list('category_id', flat=True))
+    with transaction.atomic():
+        store_sold(totals, product_ids)
+        rank_categories(category_ids)
+    transaction.on_commit(lambda: cache.bump_version(popularity.VERSION_NAME))
+    return len(product_ids)
+
+
+def mark_stale(product_ids):
+    """
+    Queue products for the next incremental update.
+    """
+    from .models import BestSellerQueue
+
+    enqueue(BestSellerQueue, product_ids)
+
+
+def update_stale(now=None):
+    """
+    Drain the queue. Products queued while this runs stay queued for next
+    time.
+    """
+    from .models import BestSellerQueue
+
+    with claim(BestSellerQueue) as changed_ids:
+        return update(changed_ids, now) if changed_ids else 0
@@ -0,0 +1,128 @@
+"""
+"Frequently bought together" from paid order history.
+
+Paid orders form a sparse order x product incidence matrix B, so
+`B[:, cols].T @ B` counts, for each product in `cols`, the orders it shares
+with every other product. Only the TOP_K per product with at least
+MIN_ORDERS shared orders are kept, in the BoughtTogether table.
+
+A new paid order only changes the rows of the products in it, and those rows
+can be recomputed exactly from the orders containing them, so updates are
+incremental rather than full recomputes.
+"""
+import numpy as np
+from scipy import sparse
+
+from core.batch import chunked, claim, enqueue, replace_rows
+from products.related import top_n
+
+TOP_K = 10
+BATCH_SIZE = 500
+
+# One shared basket is noise rather than a pattern.
+MIN_ORDERS = 2
+
+
+def paid_items():
+    from .models import Order, OrderItem
+
+    return OrderItem.objects.filter(order__status__in=Order.PAID_STATUSES)
+
+
+def incidence(items):
+    """
+    `(product_ids, B)`: the products seen in `items` and the 0/1 order x
+    product matrix over them. An order holding a product twice counts once.
+    """
+    pairs = np.array(list(items.values_list('order_id', 'product_id')), dtype=np.int64).reshape(-1, 2)
+    order_ids, order_rows = np.unique(pairs[:, 0], return_inverse=True)
+    product_ids, product_columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (order_rows.ravel(), product_columns.ravel())),
+        shape=(len(order_ids), len(product_ids)),
+    )
+    matrix.data[:] = 1
+    return product_ids, matrix
+
+
+def top_pairs(product_ids, matrix, columns):
+    """
+    TOP_K partners for the products at `columns`, as
+    `{product_id: [(other_id, orders), ...]}`.
+    """
+    counts = (matrix[:, columns].T @ matrix).tocsr()
+    entry_columns = np.repeat(np.asarray(columns), np.diff(counts.indptr))
+    counts.data[(counts.indices == entry_columns) | (counts.data < MIN_ORDERS)] = 0
+    counts.eliminate_zeros()
+    return top_n(counts, product_ids[columns], product_ids, TOP_K)
+
+
+def store(results):
+    """
+    Replace the stored rows of every product in `results`.
+    """
+    from .models import BoughtTogether
+
+    rows = [
+        (product_id, other_id, rank, int(orders))
+        for product_id, pairs in results.items()
+        for rank, (other_id, orders) in enumerate(pairs)
+    ]
+    replace_rows(BoughtTogether, 'product_id', results, ('product_id', 'other_id', 'rank', 'orders'), rows)
+
+
+def compute(product_ids, matrix, columns, batch_size=BATCH_SIZE):
+    for start in range(0, len(columns), batch_size):
+        store(top_pairs(product_ids, matrix, columns[start:start + batch_size]))
+    return len(columns)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """
+    Recompute every product from the whole paid history, clearing whatever
+    was queued before it started.
+    """
+    from .models import BoughtTogether, BoughtTogetherQueue
+
+    with claim(BoughtTogetherQueue):
+        product_ids, matrix = incidence(paid_items())
+        BoughtTogether.objects.exclude(product_id__in=paid_items().values('product_id')).delete()
+        return compute(product_ids, matrix, np.arange(len(product_ids)), batch_size)
+
+
+def update(product_ids, batch_size=BATCH_SIZE):
+    """
+    Recompute the given products exactly, reading only the paid orders that
+    contain at least one of them.
+    """
+    from .models import BoughtTogether
+
+    written = 0
+    for chunk in chunked(product_ids):
+        orders = paid_items().filter(product_id__in=chunk).values('order_id')
+        seen_ids, matrix = incidence(paid_items().filter(order_id__in=orders))
+        columns = np.flatnonzero(np.isin(seen_ids, chunk))
+        written += compute(seen_ids, matrix, columns, batch_size)
+        # No paid orders left (e.g. the only one was cancelled).
+        BoughtTogether.objects.filter(product_id__in=set(chunk) - set(seen_ids.tolist())).delete()
+    return written
+
+
+def mark_stale(product_ids):
+    """
+    Queue products for the next incremental update.
+    """
+    from .models import BoughtTogetherQueue
+
+    enqueue(BoughtTogetherQueue, product_ids)
+
+
+def update_stale(batch_size=BATCH_SIZE):
+    """
+    Drain the queue. Products queued while this runs stay queued for next
+    time.
+    """
+    from .models import BoughtTogetherQueue
+
+    with claim(BoughtTogetherQueue) as changed_ids:
+        return update(changed_ids, batch_size) if changed_ids else 0
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders import best_sellers
+
+
+class Command(BaseCommand):
+    help = (
+        "Recount best sellers for products in newly paid or cancelled orders. Meant to run from cron, "
+        "with --full nightly so the rolling windows move along."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recount every product, not just queued ones.")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['full']:
+            written = best_sellers.rebuild()
+        else:
+            written = best_sellers.update_stale()
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated best sellers for {written} products in {time.monotonic() - started:.1f}s."
+        ))
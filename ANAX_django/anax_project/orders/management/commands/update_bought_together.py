@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders import bought_together
+
+
+class Command(BaseCommand):
+    help = "Recompute frequently-bought-together pairs for products in newly paid or cancelled orders. Meant to run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every product, not just queued ones.")
+        parser.add_argument('--batch-size', type=int, default=bought_together.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['full']:
+            written = bought_together.rebuild(options['batch_size'])
+        else:
+            written = bought_together.update_stale(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated bought-together pairs for {written} products in {time.monotonic() - started:.1f}s."
+        ))
@@ -1,6 +1,6 @@
 from django.db import models
 from accounts.models import User, Address
-from products.models import Product
+from products.models import Category, Product
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -10,6 +10,8 @@ class Order(models.Model):
         ('delivered', 'Delivered'),
         ('cancelled', 'Cancelled'),
     ]
+    # Orders whose items count as purchases, e.g. for recommendations.
+    PAID_STATUSES = ('paid', 'shipped', 'delivered')
     
     customer = models.ForeignKey(User, on_delete=models.CASCADE)
     order_number = models.CharField(max_length=20, unique=True)
@@ -22,6 +24,14 @@ class Order(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # A customer's orders, keyset-paginated on (created_at, id).
+            models.Index(fields=['customer', 'created_at', 'id'], name='orders_customer_created_idx'),
+            # Paid orders in a rolling window, see orders.best_sellers.
+            models.Index(fields=['created_at', 'status'], name='orders_created_status_idx'),
+        ]
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -32,3 +42,37 @@ class OrderTracking(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
     status = models.CharField(max_length=20)
     timestamp = models.DateTimeField(auto_now_add=True)
+
+class BoughtTogether(models.Model):
+    # Top-K products that appear in the same paid orders as `product`, with
+    # how many orders they share; written by orders.bought_together.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='bought_together')
+    other = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+
+class BoughtTogetherQueue(models.Model):
+    # Products in orders that became paid (or stopped being) since their
+    # rows were last computed; drained by `manage.py update_bought_together`.
+    # A bare id: items are queued while their product is being deleted.
+    product_id = models.BigIntegerField(primary_key=True)
+
+class BestSeller(models.Model):
+    # The top sellers of each category by units sold in paid orders over the
+    # last `window` days; written by orders.best_sellers, `rank` 0 is the best.
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='+')
+    window = models.PositiveSmallIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('category', 'window', 'rank')
+
+class BestSellerQueue(models.Model):
+    # Products whose sales changed since they were last counted; drained by
+    # `manage.py update_best_sellers`. A bare id, like BoughtTogetherQueue.
+    product_id = models.BigIntegerField(primary_key=True)
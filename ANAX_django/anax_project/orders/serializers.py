@@ -1,21 +1,30 @@
 from rest_framework import serializers
 from .models import Order, OrderItem
-from products.serializers import ProductSerializer
+from core.fieldsets import ExpandableFieldsMixin, SparseFieldsetMixin
+from products.serializers import ProductSerializer, ProductSummarySerializer
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    product = ProductSerializer(read_only=True)
+class OrderItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    product = ProductSummarySerializer(read_only=True)  # ?expand=items.product for the full product
     
     class Meta:
         model = OrderItem
         fields = ['id', 'product', 'quantity', 'price']
+        expandable_fields = {'product': ProductSerializer}
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
+    total_amount = serializers.SerializerMethodField()
     
     class Meta:
         model = Order
-        fields = ['id', 'user', 'status', 'total_amount', 'delivery_fee', 
+        fields = ['id', 'customer', 'status', 'total_amount', 'delivery_fee', 
                  'discount_applied', 'created_at', 'items']
+        field_sources = {'total_amount': ['items', 'delivery_fee', 'discount_applied']}
+
+    def get_total_amount(self, obj):
+        # Uses the prefetched items rather than an extra aggregate per order.
+        subtotal = sum(item.price * item.quantity for item in obj.items.all())
+        return str(subtotal + obj.delivery_fee - obj.discount_applied)
 
 class OrderCreateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,35 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import best_sellers, bought_together
+from .models import Order, OrderItem
+
+# Saving an order in one of these can change what counts as bought together
+# and what sold.
+SALES_STATUSES = set(Order.PAID_STATUSES) | {'cancelled'}
+
+
+def sales_changed(product_ids):
+    product_ids = set(product_ids)
+    bought_together.mark_stale(product_ids)
+    best_sellers.mark_stale(product_ids)
+
+
+@receiver(post_save, sender=Order)
+def queue_order_products(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw or instance.status not in SALES_STATUSES:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    sales_changed(instance.items.values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def queue_order_item_products(sender, instance, raw=False, **kwargs):
+    # Items edited on an order that already counts; the removed product's
+    # row changes as well as those of what is still in the basket.
+    if raw or not Order.objects.filter(pk=instance.order_id, status__in=Order.PAID_STATUSES).exists():
+        return
+    product_ids = set(OrderItem.objects.filter(order_id=instance.order_id).values_list('product_id', flat=True))
+    sales_changed(product_ids | {instance.product_id})
@@ -1,3 +1,174 @@
-from django.test import TestCase
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from core.testing import QueryBudgetTestCase, TemporaryMediaMixin
+from products.models import Category, Product, ProductImage, ProductStats
+from . import best_sellers, bought_together
+from .models import BestSellerQueue, BoughtTogether, BoughtTogetherQueue, Order, OrderItem
+from .views import BestSellersAPIView, BoughtTogetherAPIView
+
+
+class OrderExpandTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='buyer', password='x')
+        order = Order.objects.create(customer=cls.user, order_number='ORD-1', delivery_fee=Decimal('5.00'))
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Mug {i}', description='Stoneware', price=Decimal('8.00'), condition='new', sku=f'MUG-{i}',
+            )
+            ProductImage.objects.create(product=product, image=SimpleUploadedFile(f'm{i}.jpg', b'img'))
+            OrderItem.objects.create(order=order, product=product, quantity=2, price=product.price)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_items_show_product_summary_by_default(self):
+        # Orders, items and their products; nothing about images or tags.
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('order-list'))
+        order = response.data['results'][0]
+        self.assertEqual(order['total_amount'], '53.00')
+        self.assertEqual(set(order['items'][0]['product']), {'id', 'name', 'sku', 'price'})
+
+    def test_expand_nested_product_and_images(self):
+        product = self.client.get(reverse('order-list'), {'expand': 'items.product'}).data['results'][0]['items'][0]['product']
+        self.assertEqual(product['description'], 'Stoneware')
+        self.assertIsInstance(product['images'][0], int)
+
+        response = self.client.get(reverse('order-list'), {'expand': 'items.product.images'})
+        product = response.data['results'][0]['items'][0]['product']
+        self.assertIn('variants', product['images'][0])
+
+
+class BoughtTogetherTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='basket', password='x')
+        self.client.force_authenticate(self.user)
+        self.tea, self.cups, self.honey, self.lamp = (
+            Product.objects.create(name=name, description='', price=Decimal('4.00'), condition='new', sku=name.upper())
+            for name in ('Tea', 'Cups', 'Honey', 'Lamp')
+        )
+        self.orders = 0
+
+    def order(self, *products, status='paid'):
+        self.orders += 1
+        order = Order.objects.create(customer=self.user, order_number=f'BT-{self.orders}')
+        for product in products:
+            OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+        order.status = status
+        order.save()
+        return order
+
+    def others(self, product):
+        return list(
+            BoughtTogether.objects.filter(product=product).order_by('rank').values_list('other_id', 'orders')
+        )
+
+    def test_rebuild_counts_paid_orders_only(self):
+        self.order(self.tea, self.cups, self.honey)
+        self.order(self.tea, self.cups)
+        self.order(self.tea, self.honey)
+        self.order(self.tea, self.lamp, status='pending')
+        self.order(self.tea, self.lamp, status='pending')
+        bought_together.rebuild()
+        self.assertEqual(self.others(self.tea), [(self.cups.pk, 2), (self.honey.pk, 2)])
+        # One shared order is below MIN_ORDERS.
+        self.assertEqual(self.others(self.cups), [(self.tea.pk, 2)])
+
+        url = reverse('bought-together', kwargs={'product_id': self.tea.pk})
+        response = self.assertWithinQueryBudget(BoughtTogetherAPIView, url)
+        self.assertEqual([item['name'] for item in response.data], ['Cups', 'Honey'])
+
+    def test_new_and_cancelled_orders_update_incrementally(self):
+        self.order(self.tea, self.lamp)
+        self.assertEqual(bought_together.update_stale(), 2)
+        self.assertEqual(self.others(self.tea), [])
+
+        second = self.order(self.tea, self.lamp)
+        call_command('update_bought_together', stdout=StringIO())
+        self.assertEqual(self.others(self.lamp), [(self.tea.pk, 2)])
+        self.assertFalse(BoughtTogetherQueue.objects.exists())
+
+        second.status = 'cancelled'
+        second.save()
+        bought_together.update_stale()
+        self.assertEqual(self.others(self.lamp), [])
+
+
+class BestSellerTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='till', password='x')
+        self.client.force_authenticate(self.user)
+        self.kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.garden = Category.objects.create(name='Garden', slug='garden')
+        self.kettle = self.product('Kettle', self.kitchen)
+        self.pan = self.product('Pan', self.kitchen)
+        self.hose = self.product('Hose', self.garden)
+        self.orders = 0
+
+    def product(self, name, category):
+        return Product.objects.create(
+            name=name, description='', price=Decimal('9.00'), category=category, condition='new', sku=name.upper(),
+        )
+
+    def order(self, product, quantity, status='paid', days_ago=0):
+        self.orders += 1
+        order = Order.objects.create(customer=self.user, order_number=f'BS-{self.orders}')
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price=product.price)
+        order.created_at = timezone.now() - timedelta(days=days_ago)
+        order.status = status
+        order.save()
+        return order
+
+    def best_sellers(self, category, window=None):
+        url = reverse('best-sellers', kwargs={'category_id': category.pk})
+        params = {} if window is None else {'window': window}
+        response = self.assertWithinQueryBudget(BestSellersAPIView, url, data=params)
+        return [item['name'] for item in response.data]
+
+    def test_rebuild_ranks_each_window(self):
+        self.order(self.kettle, 3)
+        self.order(self.pan, 1)
+        self.order(self.pan, 5, days_ago=20)
+        self.order(self.hose, 10, status='pending')
+        best_sellers.rebuild()
+
+        self.assertEqual(self.best_sellers(self.kitchen, 7), ['Kettle', 'Pan'])
+        self.assertEqual(self.best_sellers(self.kitchen), ['Pan', 'Kettle'])
+        self.assertEqual(self.best_sellers(self.garden), [])
+        stats = ProductStats.objects.get(product=self.pan)
+        self.assertEqual((stats.sold_7d, stats.sold_30d, stats.sold_90d), (1, 6, 6))
+
+        response = self.client.get(reverse('product-list'), {'ordering': '-best_selling'})
+        self.assertEqual([item['name'] for item in response.data['results']], ['Pan', 'Kettle', 'Hose'])
+
+        self.assertEqual(self.client.get(reverse('best-sellers', kwargs={'category_id': 999})).status_code, 404)
+        url = reverse('best-sellers', kwargs={'category_id': self.kitchen.pk})
+        self.assertEqual(self.client.get(url, {'window': 5}).status_code, 400)
+        self.assertEqual([item['name'] for item in self.client.get(url, {'limit': -1}).data], ['Pan'])
+
+    def test_paid_and_cancelled_orders_update_incrementally(self):
+        self.order(self.kettle, 3)
+        today = self.order(self.pan, 4)
+        best_sellers.rebuild()
+        self.assertEqual(self.best_sellers(self.kitchen, 7), ['Pan', 'Kettle'])
+
+        self.order(self.hose, 2)
+        today.status = 'cancelled'
+        today.save()
+        self.assertEqual(
+            set(BestSellerQueue.objects.values_list('product_id', flat=True)), {self.hose.pk, self.pan.pk},
+        )
+        call_command('update_best_sellers', stdout=StringIO())
+        self.assertFalse(BestSellerQueue.objects.exists())
+        self.assertEqual(self.best_sellers(self.kitchen, 7), ['Kettle'])
+        self.assertEqual(self.best_sellers(self.garden, 7), ['Hose'])
+        self.assertEqual(ProductStats.objects.get(product=self.pan).sold_90d, 0)
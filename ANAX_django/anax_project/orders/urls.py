@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import OrderListAPIView, OrderDetailAPIView, OrderCreateAPIView
+from .views import OrderListAPIView, OrderDetailAPIView, OrderCreateAPIView, BoughtTogetherAPIView, BestSellersAPIView
 
 urlpatterns = [
     path('', OrderListAPIView.as_view(), name='order-list'),
     path('<int:pk>/', OrderDetailAPIView.as_view(), name='order-detail'),
     path('create/', OrderCreateAPIView.as_view(), name='order-create'),
+    path('bought-together/<int:product_id>/', BoughtTogetherAPIView.as_view(), name='bought-together'),
+    path('best-sellers/<int:category_id>/', BestSellersAPIView.as_view(), name='best-sellers'),
 ]
@@ -1,22 +1,41 @@
+from django.http import Http404
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import Order
+from core.fieldsets import ExpandableQuerysetMixin, SparseQuerysetMixin
+from products.models import Category, Product
+from products.search import order_by_ids
+from products.serializers import ProductSerializer
+from . import best_sellers
+from .models import BestSeller, BoughtTogether, Order
 from .serializers import OrderSerializer, OrderCreateSerializer
 
-class OrderListAPIView(generics.ListAPIView):
+# Items show a product summary; the rest of the product is only loaded
+# when the client asks for it with ?expand=items.product.
+ORDER_EXPAND_PREFETCHES = {
+    'items.product': ['items__product__images', 'items__product__tags', 'items__product__category'],
+}
+
+class OrderListAPIView(SparseQuerysetMixin, ExpandableQuerysetMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
+    expand_prefetches = ORDER_EXPAND_PREFETCHES
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user).order_by('-created_at')
+        return (
+            Order.objects.filter(customer=self.request.user)
+            .prefetch_related('items__product')
+            .order_by('-created_at')
+        )
 
-class OrderDetailAPIView(generics.RetrieveAPIView):
+class OrderDetailAPIView(SparseQuerysetMixin, ExpandableQuerysetMixin, generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = OrderSerializer
+    expand_prefetches = ORDER_EXPAND_PREFETCHES
 
     def get_queryset(self):
-        return Order.objects.filter(user=self.request.user)
+        return Order.objects.filter(customer=self.request.user).prefetch_related('items__product')
 
 class OrderCreateAPIView(generics.CreateAPIView):
     permission_classes = [IsAuthenticated]
@@ -24,3 +43,53 @@ class OrderCreateAPIView(generics.CreateAPIView):
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
+
+class BoughtTogetherAPIView(generics.ListAPIView):
+    """
+    Products most often in the same paid orders as this one, best first
+    (see orders.bought_together).
+    """
+    serializer_class = ProductSerializer
+    pagination_class = None
+    default_expand = ['images']
+    query_budget = 4  # pair ids + products + images + tags
+
+    def get_queryset(self):
+        product_id = self.kwargs['product_id']
+        ids = list(
+            BoughtTogether.objects.filter(product_id=product_id).order_by('rank').values_list('other_id', flat=True)
+        )
+        if not ids and not Product.objects.filter(pk=product_id).exists():
+            raise Http404
+        return order_by_ids(Product.objects.with_relations().filter(is_active=True), ids)
+
+class BestSellersAPIView(generics.ListAPIView):
+    """
+    A category's best sellers by units sold over the last `?window=` days
+    (7, 30 or 90), best first (see orders.best_sellers).
+    """
+    serializer_class = ProductSerializer
+    pagination_class = None
+    default_expand = ['images']
+    query_budget = 4  # ranked ids + products + images + tags
+
+    def get_queryset(self):
+        category_id = self.kwargs['category_id']
+        try:
+            window = int(self.request.query_params.get('window', best_sellers.DEFAULT_WINDOW))
+        except ValueError:
+            window = None
+        if window not in best_sellers.WINDOWS:
+            raise ValidationError({'window': f'Must be one of {", ".join(map(str, best_sellers.WINDOWS))}.'})
+        try:
+            limit = min(int(self.request.query_params.get('limit', best_sellers.TOP_N)), best_sellers.TOP_N)
+        except ValueError:
+            limit = best_sellers.TOP_N
+        ids = list(
+            BestSeller.objects.filter(category_id=category_id, window=window)
+            .order_by('rank')
+            .values_list('product_id', flat=True)[:max(limit, 1)]
+        )
+        if not ids and not Category.objects.filter(pk=category_id).exists():
+            raise Http404
+        return order_by_ids(Product.objects.with_relations().filter(is_active=True), ids)
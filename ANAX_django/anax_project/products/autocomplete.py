@@ -0,0 +1,152 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from . import cache as versions
+
+VERSION_NAME = 'autocomplete'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+def prefix_keys(name, sku):
+    """
+    Keys a product is reachable under: every word-start suffix of its name
+    ("galaxy s23" for "Samsung Galaxy S23") plus its SKU.
+    """
+    words = normalize(name).split()
+    keys = {' '.join(words[i:]) for i in range(len(words))}
+    sku = normalize(sku)
+    if sku:
+        keys.add(sku)
+    return keys
+
+
+class PrefixIndex:
+    """
+    Sorted array of (key, product id) pairs. A prefix query is a binary search
+    to the first key >= the prefix followed by a scan while keys still match.
+
+    Saves update the index in place from on-commit hooks on other request
+    threads, so every read and write holds the index's lock.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.keys = {}
+        self.labels = {}
+        self._lock = threading.RLock()
+
+    def add(self, pk, name, sku):
+        with self._lock:
+            self.remove(pk)
+            keys = prefix_keys(name, sku)
+            for key in keys:
+                insort(self.entries, (key, pk))
+            self.keys[pk] = keys
+            self.labels[pk] = {'id': pk, 'name': name, 'sku': sku}
+
+    def remove(self, pk):
+        with self._lock:
+            for key in self.keys.pop(pk, ()):
+                position = bisect_left(self.entries, (key, pk))
+                if position < len(self.entries) and self.entries[position] == (key, pk):
+                    del self.entries[position]
+            self.labels.pop(pk, None)
+
+    def bulk_load(self, rows):
+        with self._lock:
+            for pk, name, sku in rows:
+                keys = prefix_keys(name, sku)
+                self.entries.extend((key, pk) for key in keys)
+                self.keys[pk] = keys
+                self.labels[pk] = {'id': pk, 'name': name, 'sku': sku}
+            self.entries.sort()
+
+    def lookup(self, prefix, limit):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found = []
+        seen = set()
+        with self._lock:
+            position = bisect_left(self.entries, (prefix,))
+            while position < len(self.entries) and len(found) < limit:
+                key, pk = self.entries[position]
+                if not key.startswith(prefix):
+                    break
+                if pk not in seen:
+                    seen.add(pk)
+                    found.append(self.labels[pk])
+                position += 1
+        return found
+
+
+_lock = threading.Lock()
+_index = None
+_loaded_version = None
+
+
+def _build():
+    from .models import Product
+
+    index = PrefixIndex()
+    index.bulk_load(
+        Product.objects.filter(is_active=True).values_list('pk', 'name', 'sku').iterator()
+    )
+    return index
+
+
+def get_index():
+    """
+    This process's index, rebuilt from the database when another worker has
+    bumped the shared version since we last loaded it.
+    """
+    global _index, _loaded_version
+    version = versions.get_version(VERSION_NAME)
+    if _index is None or version != _loaded_version:
+        with _lock:
+            if _index is None or version != _loaded_version:
+                _index = _build()
+                _loaded_version = version
+    return _index
+
+
+def _apply(change):
+    global _loaded_version
+    with _lock:
+        if _index is not None:
+            change(_index)
+        version = versions.bump_version(VERSION_NAME)
+        # Our copy already reflects this write; only other workers reload.
+        if _index is not None and _loaded_version == version - 1:
+            _loaded_version = version
+
+
+def update_product(product):
+    if product.is_active:
+        _apply(lambda index: index.add(product.pk, product.name, product.sku))
+    else:
+        remove_product(product.pk)
+
+
+def remove_product(pk):
+    _apply(lambda index: index.remove(pk))
+
+
+def invalidate():
+    """
+    Force every worker, this one included, to reload on the next lookup.
+    """
+    global _index
+    with _lock:
+        _index = None
+        versions.bump_version(VERSION_NAME)
+
+
+def lookup(prefix, limit=10):
+    return get_index().lookup(prefix, limit)
@@ -0,0 +1,82 @@
+import json
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.batch import chunked
+from core.models import AuditLog
+from .models import Product
+from .signals import products_bulk_changed
+
+UPDATABLE_FIELDS = ('price', 'label', 'is_active')
+
+
+def _resolve_ids(entries):
+    """
+    Map every entry to a product id, looking SKUs up in chunked IN queries.
+    Entries whose id or SKU doesn't exist are returned separately.
+    """
+    wanted_ids = {entry['id'] for entry in entries if 'id' in entry}
+    wanted_skus = [entry['sku'] for entry in entries if 'id' not in entry]
+    known_ids, sku_ids = set(), {}
+    for chunk in chunked(wanted_ids):
+        known_ids.update(Product.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+    for chunk in chunked(wanted_skus):
+        sku_ids.update(Product.objects.filter(sku__in=chunk).values_list('sku', 'pk'))
+
+    resolved, missing = [], []
+    for entry in entries:
+        pk = entry['id'] if 'id' in entry else sku_ids.get(entry['sku'])
+        if pk is None or ('id' in entry and pk not in known_ids):
+            missing.append(entry.get('id', entry.get('sku')))
+        else:
+            resolved.append((pk, entry))
+    return resolved, missing
+
+
+def bulk_update_products(entries, username):
+    """
+    Apply `{id|sku, price?, label?, is_active?}` entries in one transaction.
+
+    Each row is one execution of the same prepared UPDATE via executemany,
+    with COALESCE leaving fields an entry doesn't mention untouched. That is
+    far cheaper than Django's bulk_update(), whose CASE WHEN per row grows the
+    statement with the batch. A single AuditLog row records the whole batch.
+    """
+    ops = connection.ops
+    now = ops.adapt_datetimefield_value(timezone.now())
+    with transaction.atomic():
+        resolved, missing = _resolve_ids(entries)
+        rows = [
+            (
+                ops.adapt_decimalfield_value(entry.get('price'), 10, 2),
+                entry.get('label'),
+                entry.get('is_active'),
+                now,
+                pk,
+            )
+            for pk, entry in resolved
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {Product._meta.db_table} SET "
+                "price = COALESCE(%s, price), label = COALESCE(%s, label), "
+                "is_active = COALESCE(%s, is_active), updated_at = %s WHERE id = %s",
+                rows,
+            )
+
+        product_ids = sorted({pk for pk, _ in resolved})
+        fields = sorted({name for _, entry in resolved for name in UPDATABLE_FIELDS if name in entry})
+        AuditLog.objects.create(
+            action='product_bulk_update',
+            user=username,
+            description=json.dumps({
+                'updated': len(product_ids),
+                'fields': fields,
+                'not_found': missing[:100],
+                'product_ids': product_ids,
+            }),
+        )
+        if product_ids:
+            products_bulk_changed.send(sender=Product, product_ids=product_ids, fields=fields)
+    return {'updated': len(product_ids), 'not_found': missing}
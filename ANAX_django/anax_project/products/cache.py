@@ -0,0 +1,87 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+VERSION_KEY = 'products:version:{}'
+
+
+def initial_version():
+    # Counters start from the clock rather than 1, so one recreated after
+    # the cache is flushed never repeats a value a process still holds.
+    return time.time_ns() // 1_000_000
+
+
+def get_version(name):
+    """
+    Current value of a named invalidation counter shared through the cache.
+    """
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        initial = initial_version()
+        cache.add(key, initial, timeout=None)
+        version = cache.get(key, initial)
+    return version
+
+
+def get_versions(names):
+    """
+    `{name: version}` for many counters, in one cache round trip once they
+    all exist.
+    """
+    keys = {VERSION_KEY.format(name): name for name in names}
+    versions = {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
+    for name in set(keys.values()) - versions.keys():
+        versions[name] = get_version(name)
+    return versions
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        initial = initial_version()
+        cache.add(key, initial, timeout=None)
+        return cache.get(key, initial)
+
+
+BUILD_LOCK_TIMEOUT = 30
+BUILD_WAIT = 5
+BUILD_POLL_INTERVAL = 0.05
+
+# Striped so unrelated keys rarely contend and the set of locks stays bounded.
+_build_locks = [threading.Lock() for _ in range(64)]
+
+
+def get_or_build(key, build, timeout=None):
+    """
+    Cached value for `key`, calling `build()` to fill it on a miss. Concurrent
+    misses collapse into a single build: threads in this process queue on a
+    local lock, and other processes on a short-lived marker claimed with
+    cache.add(), polling for the result rather than building it again.
+    """
+    value = cache.get(key)
+    if value is not None:
+        return value
+    with _build_locks[hash(key) % len(_build_locks)]:
+        value = cache.get(key)
+        if value is not None:
+            return value
+        marker = f'{key}:building'
+        if cache.add(marker, 1, timeout=BUILD_LOCK_TIMEOUT):
+            try:
+                value = build()
+                cache.set(key, value, timeout)
+                return value
+            finally:
+                cache.delete(marker)
+        deadline = time.monotonic() + BUILD_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(BUILD_POLL_INTERVAL)
+            value = cache.get(key)
+            if value is not None:
+                return value
+    # Whoever claimed the build is stuck or gone; serve without caching.
+    return build()
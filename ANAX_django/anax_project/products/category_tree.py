@@ -0,0 +1,47 @@
+import hashlib
+
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from . import cache as versions
+
+VERSION_NAME = 'category_tree'
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def build_tree():
+    """
+    The whole hierarchy as nested dicts, from one query. Ordering by the
+    materialized path guarantees every parent is seen before its children.
+    """
+    from .models import Category
+
+    nodes = {}
+    roots = []
+    for pk, name, slug, parent_id in Category.objects.order_by('path').values_list(
+        'pk', 'name', 'slug', 'parent_id',
+    ):
+        node = {'id': pk, 'name': name, 'slug': slug, 'children': []}
+        nodes[pk] = node
+        parent = nodes.get(parent_id)
+        (parent['children'] if parent else roots).append(node)
+    return roots
+
+
+def get_tree():
+    """
+    `(etag, body)` for the current tree: the rendered JSON bytes, cached per
+    version, and a digest of them for conditional requests.
+    """
+    key = f'products:category-tree:{versions.get_version(VERSION_NAME)}'
+    entry = cache.get(key)
+    if entry is None:
+        body = JSONRenderer().render(build_tree())
+        entry = (f'"{hashlib.md5(body).hexdigest()}"', body)
+        cache.set(key, entry, CACHE_TIMEOUT)
+    return entry
+
+
+def invalidate():
+    versions.bump_version(VERSION_NAME)
@@ -0,0 +1,147 @@
+"""
+Delta sync for offline catalog replicas (branch tills, mobile apps).
+
+A client starts with no cursor, pages through the whole active catalog, and
+from then on asks only for what changed since its last cursor: products
+whose updated_at moved (price, stock, images and tags all touch it) and
+products that were deleted (ProductTombstone) or deactivated, which it
+should drop.
+
+The cursor is a position in two keysets, (updated_at, id) over products and
+(deleted_at, id) over tombstones, so each batch is two indexed range scans.
+Rows newer than SETTLE_TIME are held back for a later batch: their
+timestamps are taken before they commit, so a transaction still in flight
+could otherwise land behind a cursor that has already passed it.
+"""
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import timedelta
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.pagination import KeysetPagination
+from . import lookup
+
+BATCH_SIZE = 500
+MAX_BATCH_SIZE = 2000
+SETTLE_TIME = timedelta(seconds=5)
+
+# Cursors older than this may have missed pruned tombstones and must resync.
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+FIELDS = {
+    'id': 'id',
+    'sku': 'sku',
+    'name': 'name',
+    'price': 'price',
+    'quantity': 'inventory__quantity',
+    'category': 'category_id',
+    'image': 'image',
+    'is_active': 'is_active',
+    'updated_at': 'updated_at',
+}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class ExpiredCursor(ValueError):
+    pass
+
+
+def _position(value):
+    moment, pk = value
+    moment = parse_datetime(moment)
+    if moment is None:
+        raise ValueError(value)
+    return moment, int(pk)
+
+
+def encode_cursor(products, tombstones):
+    tokens = {
+        'p': None if products is None else [str(products[0]), products[1]],
+        't': [str(tombstones[0]), tombstones[1]],
+    }
+    return urlsafe_b64encode(json.dumps(tokens, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(encoded):
+    """
+    `(products position, tombstones position)`, each `(datetime, id)`; the
+    first is None until a batch has returned a product.
+    """
+    try:
+        tokens = json.loads(urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        products = None if tokens['p'] is None else _position(tokens['p'])
+        return products, _position(tokens['t'])
+    except (TypeError, ValueError, KeyError, UnicodeError):
+        raise InvalidCursor(encoded)
+
+
+def after(field, position):
+    return KeysetPagination.seek((field, 'id'), position)
+
+
+def changes(cursor=None, limit=BATCH_SIZE):
+    """
+    The next batch after `cursor` (everything, for a client without one):
+    `{'changed': [records], 'deleted': [ids], 'cursor': ..., 'has_more': bool}`.
+    """
+    from .models import Product, ProductTombstone
+
+    settled = timezone.now() - SETTLE_TIME
+    if cursor is None:
+        # Nothing deleted before the first batch concerns a new replica.
+        product_position, tombstone_position = None, (settled, 0)
+    else:
+        product_position, tombstone_position = decode_cursor(cursor)
+        if tombstone_position[0] < timezone.now() - TOMBSTONE_RETENTION:
+            raise ExpiredCursor(cursor)
+
+    products = Product.objects.filter(updated_at__lte=settled).order_by('updated_at', 'id')
+    if product_position is not None:
+        products = products.filter(after('updated_at', product_position))
+    rows = list(lookup.records(products[:limit + 1], FIELDS))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    tombstones = list(
+        ProductTombstone.objects.filter(after('deleted_at', tombstone_position), deleted_at__lte=settled)
+        .order_by('deleted_at', 'id')
+        .values_list('deleted_at', 'id', 'product_id')[:limit + 1]
+    )
+    if len(tombstones) > limit:
+        has_more = True
+        tombstone_position = tombstones[limit - 1][:2]
+    else:
+        # Every settled tombstone was read; moving up to `settled` keeps a
+        # replica that rarely sees deletes from looking expired.
+        tombstone_position = max(tombstone_position, (settled, 0))
+    tombstones = tombstones[:limit]
+
+    if rows:
+        product_position = (rows[-1]['updated_at'], rows[-1]['id'])
+
+    changed = [row for row in rows if row['is_active']]
+    deleted = [row['id'] for row in rows if not row['is_active']]
+    deleted.extend(product_id for _, _, product_id in tombstones)
+    for row in changed:
+        del row['is_active']
+    return {
+        'changed': changed,
+        'deleted': deleted,
+        'cursor': encode_cursor(product_position, tombstone_position),
+        'has_more': has_more,
+    }
+
+
+def prune_tombstones(retention=TOMBSTONE_RETENTION):
+    """
+    Drop tombstones no live cursor can still need. Returns how many went.
+    """
+    from .models import ProductTombstone
+
+    deleted, _ = ProductTombstone.objects.filter(deleted_at__lt=timezone.now() - retention).delete()
+    return deleted
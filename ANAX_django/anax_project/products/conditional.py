@@ -0,0 +1,49 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from . import cache
+
+
+def make_etag(*parts):
+    return '"{}"'.format(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def list_validators(request, *version_names):
+    """
+    ETag for a product list, without touching the database. The `catalog`
+    version is bumped after every write that can change a listing (see
+    products.signals and ProductQuerySet.touch), and the query string covers
+    filters, ordering and the page. `version_names` adds other counters the
+    response depends on.
+    """
+    names = ('catalog', *version_names)
+    versions = cache.get_versions(names)
+    return make_etag(
+        'list',
+        [versions[name] for name in names],
+        sorted(request.query_params.lists()),
+        request.build_absolute_uri('/'),
+        request.accepted_media_type,
+    )
+
+
+def not_modified(request, etag, last_modified):
+    """
+    The 304 (or 412) response when the client's copy is still current,
+    otherwise None.
+    """
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    return response
@@ -0,0 +1,234 @@
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.db import connection, transaction
+
+from . import detail_cache, imaging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+
+
+def worker_count():
+    return getattr(settings, 'PRODUCT_IMAGE_WORKERS', None) or max(1, (os.cpu_count() or 2) // 2)
+
+
+def make_executor(workers=None):
+    """
+    Children are spawned rather than forked so they never inherit database
+    connections or request threads; they only ever import products.imaging.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers or worker_count(),
+        mp_context=multiprocessing.get_context('spawn'),
+    )
+
+
+def get_executor():
+    """
+    Process pool shared by everything in this worker process.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = make_executor()
+    return _executor
+
+
+def reset_executor(broken):
+    """
+    Drop a pool whose worker died so the next job starts a fresh one.
+    """
+    global _executor
+    with _lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def derivative_name(source_name, variant, ext):
+    directory, filename = posixpath.split(source_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derivatives', f'{stem}_{variant}.{ext}')
+
+
+def is_current(image):
+    return bool(image.image) and image.derivatives.get('source') == image.image.name
+
+
+def read_source(image):
+    with image.image.storage.open(image.image.name, 'rb') as source:
+        return source.read()
+
+
+def _count(name, change):
+    """
+    Add `change` to the reference count of `name`, creating its row if
+    needed, and return the new count. The upsert locks the row until the
+    caller's transaction ends.
+    """
+    from .models import StoredImage
+
+    quote = connection.ops.quote_name
+    table, references = quote(StoredImage._meta.db_table), quote('references')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {table} (name, {references}) VALUES (%s, %s) "
+            f"ON CONFLICT (name) DO UPDATE SET {references} = {table}.{references} + %s",
+            [name, change, change],
+        )
+    return StoredImage.objects.filter(name=name).values_list('references', flat=True).get()
+
+
+def retain(name, content, storage):
+    """
+    Count a new reference to the stored original `name`, in the transaction
+    that adds the row using it. A release that won the race since `content`
+    was saved has deleted the file by now (the count serializes the two), so
+    it is written again.
+    """
+    _count(name, 1)
+    if not storage.exists(name):
+        # An upload spooled to disk was moved into place by that save, so
+        # copy from its still-open handle rather than its old path.
+        storage.save_derived(name, File(content.file, content.name))
+
+
+def _drop(source, files, storage, change):
+    from .models import StoredImage
+
+    with transaction.atomic():
+        if _count(source, change) > 0:
+            return
+        StoredImage.objects.filter(name=source).delete()
+        # Deleted while the row is still locked, so a concurrent retain()
+        # only sees the outcome.
+        for name in set(filter(None, files)):
+            storage.delete(name)
+
+
+def release(derivatives, storage):
+    """
+    Drop one reference to an original, deleting it and its variants along
+    with the last one. Files are shared between identical uploads. Call
+    after the row that used it has been changed or deleted.
+    """
+    source = derivatives.get('source')
+    if source:
+        _drop(source, derivatives.values(), storage, -1)
+
+
+def discard(names, storage):
+    """
+    Delete originals that were saved but never retained (their rows failed
+    to insert), unless something else references them.
+    """
+    for name in names:
+        _drop(name, [name], storage, 0)
+
+
+def shared_derivatives(image):
+    """
+    Current variants of another image with the same original, if any; identical
+    uploads share a file and so can share its renders too.
+    """
+    from .models import ProductImage
+
+    return (
+        ProductImage.objects.filter(image=image.image.name, derivatives__source=image.image.name)
+        .exclude(pk=image.pk)
+        .values_list('derivatives', flat=True)
+        .first()
+    )
+
+
+def record(image, names):
+    """
+    Point the image at a new set of variants and let go of the old ones. Uses
+    a queryset update so no save signals fire again for the image.
+    """
+    from .models import Product, ProductImage
+
+    previous = image.derivatives
+    ProductImage.objects.filter(pk=image.pk).update(derivatives=names)
+    image.derivatives = names
+    Product.objects.filter(pk=image.product_id).touch()
+    detail_cache.invalidate([image.product_id])
+    if previous.get('source') != names['source']:
+        release(previous, image.image.storage)
+    return names
+
+
+def store(image, rendered):
+    """
+    Save rendered variants and record their names, replacing any previous set.
+    Variant names follow the original's, so they are shared along with it.
+    """
+    storage = image.image.storage
+    names = {'source': image.image.name}
+    for variant, (data, ext) in rendered.items():
+        names[variant] = storage.save_derived(derivative_name(image.image.name, variant, ext), ContentFile(data))
+    return record(image, names)
+
+
+def generate(image):
+    """
+    Render and store the variants in the calling process.
+    """
+    shared = shared_derivatives(image)
+    if shared:
+        return record(image, shared)
+    return store(image, imaging.render_variants(read_source(image)))
+
+
+def schedule(image_pk):
+    """
+    Render the variants for one image in the process pool and store them when
+    it finishes, without holding up the caller.
+    """
+    from .models import ProductImage
+
+    image = ProductImage.objects.filter(pk=image_pk).first()
+    if image is None or is_current(image):
+        return
+    shared = shared_derivatives(image)
+    if shared:
+        record(image, shared)
+        return
+    executor = get_executor()
+    try:
+        future = executor.submit(imaging.render_variants, read_source(image))
+    except BrokenProcessPool:
+        reset_executor(executor)
+        future = get_executor().submit(imaging.render_variants, read_source(image))
+    future.add_done_callback(partial(_finish, image_pk))
+
+
+def _finish(image_pk, future):
+    from .models import ProductImage
+
+    try:
+        rendered = future.result()
+    except Exception:
+        logger.exception("Could not render derivatives for product image %s", image_pk)
+        return
+    try:
+        image = ProductImage.objects.filter(pk=image_pk).first()
+        if image is not None:
+            store(image, rendered)
+    except Exception:
+        logger.exception("Could not generate derivatives for product image %s", image_pk)
+    finally:
+        # Runs on the pool's result thread, which would otherwise keep its
+        # own database connection open forever.
+        connection.close()
@@ -0,0 +1,42 @@
+import hashlib
+
+from core.fieldsets import requested_expansions, requested_fields
+
+from . import cache as versions
+from .category_tree import VERSION_NAME as CATEGORY_TREE_VERSION
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def version_name(product_id):
+    return f'product:{product_id}'
+
+
+def invalidate(product_ids):
+    for product_id in set(product_ids):
+        versions.bump_version(version_name(product_id))
+
+
+def cache_key(product_id, request):
+    """
+    Key for one rendered product. Bumping the product's own version, or the
+    category tree's (the payload shows the category name), retires it. Media
+    URLs are absolute, so the scheme and host are part of the key too, as is
+    any `?fields=` or `?expand=` selection.
+    """
+    variant = repr((
+        request.build_absolute_uri('/'),
+        sorted(requested_fields(request) or ()),
+        sorted(requested_expansions(request)),
+    ))
+    origin = hashlib.md5(variant.encode()).hexdigest()[:12]
+    return 'products:detail:{}:{}:{}:{}'.format(
+        product_id,
+        versions.get_version(version_name(product_id)),
+        versions.get_version(CATEGORY_TREE_VERSION),
+        origin,
+    )
+
+
+def get_payload(product_id, request, build):
+    return versions.get_or_build(cache_key(product_id, request), build, CACHE_TIMEOUT)
@@ -0,0 +1,80 @@
+import csv
+import json
+
+from django.db.models import OuterRef, Subquery
+
+from .models import Product, ProductImage
+
+CHUNK_SIZE = 2000
+
+COLUMNS = [
+    'id', 'sku', 'name', 'price', 'label', 'condition', 'is_active',
+    'category', 'quantity', 'image', 'updated_at',
+]
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    """
+    File-like object whose write() hands the line back, so csv.writer can
+    format one row at a time for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(queryset=None):
+    """
+    Flat rows for the feed, one query, with the primary image picked by a
+    correlated subquery instead of prefetching every image.
+    """
+    if queryset is None:
+        queryset = Product.objects.all()
+    primary_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'pk')
+    return (
+        queryset.order_by('pk')
+        .annotate(image=Subquery(primary_image.values('image')[:1]))
+        .values_list(
+            'id', 'sku', 'name', 'price', 'label', 'condition', 'is_active',
+            'category__slug', 'inventory__quantity', 'image', 'updated_at',
+        )
+    )
+
+
+def iter_records(queryset=None, build_url=None):
+    """
+    Rows as dicts, read from a server-side chunked iterator so memory stays
+    flat however large the catalog is.
+    """
+    storage = ProductImage._meta.get_field('image').storage
+    for values in export_queryset(queryset).iterator(chunk_size=CHUNK_SIZE):
+        record = dict(zip(COLUMNS, values))
+        record['price'] = str(record['price'])
+        record['quantity'] = record['quantity'] or 0
+        record['updated_at'] = record['updated_at'].isoformat()
+        if record['image']:
+            url = storage.url(record['image'])
+            record['image'] = build_url(url) if build_url else url
+        yield record
+
+
+def iter_ndjson(records):
+    for record in records:
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def iter_csv(records):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for record in records:
+        yield writer.writerow([record[column] for column in COLUMNS])
+
+
+def iter_export(fmt, queryset=None, build_url=None):
+    records = iter_records(queryset, build_url)
+    return iter_csv(records) if fmt == 'csv' else iter_ndjson(records)
@@ -0,0 +1,86 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db.models import Case, CharField, Count, F, Value, When
+from django.db.models.functions import Cast
+
+from . import cache as versions
+
+CACHE_TIMEOUT = 60 * 15
+
+# (label, lower bound inclusive, upper bound exclusive)
+PRICE_BUCKETS = [
+    ('0-50', None, 50),
+    ('50-100', 50, 100),
+    ('100-500', 100, 500),
+    ('500-1000', 500, 1000),
+    ('1000+', 1000, None),
+]
+
+# Query parameters that page or sort a listing without changing which rows
+# match, so they don't take part in the cache key.
+IGNORED_PARAMS = {'cursor', 'page_size', 'ordering', 'count'}
+
+
+def _price_bucket():
+    whens = []
+    for label, low, high in PRICE_BUCKETS:
+        bounds = {}
+        if low is not None:
+            bounds['price__gte'] = low
+        if high is not None:
+            bounds['price__lt'] = high
+        whens.append(When(then=Value(label), **bounds))
+    return Case(*whens, output_field=CharField())
+
+
+def facet_counts(queryset):
+    """
+    Counts per category, condition, label, tag and price bucket for the rows
+    in `queryset`, computed by one UNION ALL of grouped selects so the whole
+    facet panel costs a single round trip.
+    """
+    base = queryset.order_by()
+    facets = {
+        'category': Cast('category_id', CharField()),
+        'condition': F('condition'),
+        'label': F('label'),
+        'tag': Cast('tags__id', CharField()),
+        'price': _price_bucket(),
+    }
+    parts = [
+        base.annotate(facet=Value(name, output_field=CharField()), value=expression)
+        .values('facet', 'value')
+        .annotate(total=Count('pk', distinct=True))
+        .values_list('facet', 'value', 'total')
+        for name, expression in facets.items()
+    ]
+    counts = {name: [] for name in facets}
+    for name, value, total in parts[0].union(*parts[1:], all=True):
+        if value in (None, ''):
+            continue
+        if name in ('category', 'tag'):
+            value = int(value)
+        counts[name].append({'value': value, 'count': total})
+    for values in counts.values():
+        values.sort(key=lambda item: -item['count'])
+    return counts
+
+
+def cache_key(query_params):
+    normalized = sorted(
+        (key, sorted(query_params.getlist(key)))
+        for key in query_params
+        if key not in IGNORED_PARAMS
+    )
+    digest = hashlib.sha1(repr(normalized).encode('utf-8')).hexdigest()
+    return f"products:facets:{versions.get_version('catalog')}:{digest}"
+
+
+def cached_facet_counts(query_params, build_queryset):
+    key = cache_key(query_params)
+    counts = cache.get(key)
+    if counts is None:
+        counts = facet_counts(build_queryset())
+        cache.set(key, counts, CACHE_TIMEOUT)
+    return counts
@@ -0,0 +1,79 @@
+import django_filters
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Concat, Left, Length
+from rest_framework.filters import OrderingFilter
+
+from .models import Category, Product
+
+
+class ProductFilter(django_filters.FilterSet):
+    category_tree = django_filters.CharFilter(method='filter_category_tree')
+
+    class Meta:
+        model = Product
+        fields = {
+            'category': ['exact'],
+            'price': ['gte', 'lte'],
+            'is_active': ['exact'],
+        }
+
+    def filter_category_tree(self, queryset, name, value):
+        """
+        Products anywhere under the category with slug `value`, as one query:
+        the subtree is a range scan on the indexed `Category.path`.
+        """
+        root = Category.objects.filter(slug=value)
+        lower = Subquery(root.values('path')[:1])
+        upper = Subquery(
+            root.annotate(upper=Concat(Left('path', Length('path') - 1), Value('0')))
+            .values('upper')[:1]
+        )
+        subtree = Category.objects.filter(path__gte=lower, path__lt=upper)
+        return queryset.filter(category__in=subtree)
+
+
+# ?ordering= names served from ProductStats: popularity is trending and
+# views most viewed (products.popularity), best_selling units sold over 30
+# days or the window in its suffix (orders.best_sellers). As with any other
+# field, `-popularity` etc. puts the top first.
+STATS_ORDERINGS = {
+    'popularity': 'stats__popularity',
+    'views': 'stats__views',
+    'best_selling': 'stats__sold_30d',
+    'best_selling_7d': 'stats__sold_7d',
+    'best_selling_30d': 'stats__sold_30d',
+    'best_selling_90d': 'stats__sold_90d',
+}
+
+
+def stats_ordering(request):
+    """
+    Whether `?ordering=` sorts by any ProductStats column.
+    """
+    terms = request.query_params.get(OrderingFilter.ordering_param, '').split(',')
+    return any(term.strip().lstrip('-') in STATS_ORDERINGS for term in terms)
+
+
+class ProductOrderingFilter(OrderingFilter):
+    """
+    OrderingFilter that also accepts the STATS_ORDERINGS names, anywhere in
+    the list. Every product has a stats row, so sorting by one is an inner
+    join the database drives from the stats index, reading only one page of
+    rows.
+    """
+
+    def get_valid_fields(self, queryset, view, context={}):
+        return super().get_valid_fields(queryset, view, context) + [(name, name) for name in STATS_ORDERINGS]
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view)
+        if not ordering:
+            return queryset
+        names = {term.lstrip('-') for term in ordering} & STATS_ORDERINGS.keys()
+        if names:
+            # Annotated under their own names, so the keyset paginator can
+            # seek on them.
+            queryset = queryset.filter(stats__isnull=False).annotate(
+                **{name: F(STATS_ORDERINGS[name]) for name in names}
+            )
+        return queryset.order_by(*ordering)
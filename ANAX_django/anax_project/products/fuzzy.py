@@ -0,0 +1,100 @@
+import re
+
+from django.db.models import Count
+
+from core.batch import replace_rows
+
+# Same default as PostgreSQL's pg_trgm.word_similarity_threshold.
+SIMILARITY_THRESHOLD = 0.6
+
+# How many products sharing the most trigrams with the query are re-scored.
+CANDIDATES = 200
+
+MAX_RESULTS = 50
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def trigrams(text):
+    """
+    pg_trgm style trigrams: each lower-cased word is padded with two leading
+    spaces and one trailing space, so word starts weigh more than middles.
+    """
+    grams = set()
+    for word in WORD_RE.findall((text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """
+    Jaccard similarity of two trigram sets.
+    """
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+def word_similarity(query, text):
+    """
+    Share of the query's trigrams found in `text`, so a short query can match
+    one word of a long product name.
+    """
+    if not query:
+        return 0.0
+    return len(query & text) / len(query)
+
+
+def index_products(products):
+    """
+    Replace the trigram rows for the given products with ones built from their
+    current name and SKU. Rows go in through executemany rather than model
+    instances; a bulk import writes a couple of dozen trigrams per product.
+    """
+    from .models import ProductTrigram
+
+    products = list(products)
+    if not products:
+        return
+    rows = [
+        (product.pk, gram)
+        for product in products
+        for gram in trigrams(product.name) | trigrams(product.sku)
+    ]
+    replace_rows(ProductTrigram, 'product_id', [p.pk for p in products], ('product_id', 'trigram'), rows)
+
+
+def search_product_ids(terms, queryset=None, limit=MAX_RESULTS, threshold=SIMILARITY_THRESHOLD):
+    """
+    Ids of products (from `queryset`, when given) whose name or SKU is
+    similar to `terms`, most similar first. Candidates are picked by shared
+    trigram count in the database and then scored exactly against the name
+    and SKU separately, all in one query.
+    """
+    from .models import Product, ProductTrigram
+
+    query = trigrams(terms)
+    if not query:
+        return []
+
+    trigram_rows = ProductTrigram.objects.filter(trigram__in=query)
+    if queryset is not None:
+        trigram_rows = trigram_rows.filter(product__in=queryset.order_by().values('pk'))
+    candidates = (
+        trigram_rows.values('product_id')
+        .annotate(hits=Count('id'))
+        .order_by('-hits')
+        .values('product_id')[:CANDIDATES]
+    )
+    scored = []
+    for pk, name, sku in Product.objects.filter(pk__in=candidates).values_list('pk', 'name', 'sku'):
+        best = max(
+            (word_similarity(query, grams), similarity(query, grams))
+            for grams in (trigrams(name), trigrams(sku))
+        )
+        if best[0] >= threshold:
+            scored.append((best, pk))
+    scored.sort(key=lambda item: (-item[0][0], -item[0][1], item[1]))
+    return [pk for _, pk in scored[:limit]]
@@ -0,0 +1,48 @@
+"""
+Pure Pillow helpers for product image derivatives. Nothing here touches
+Django, so worker processes can import it without setting up the project.
+"""
+from io import BytesIO
+
+from PIL import Image, ImageOps, features
+
+# name -> ((width, height), crop). Cropped variants are exactly that size;
+# the others fit inside it and are never upscaled.
+VARIANTS = {
+    'thumb': ((200, 200), True),
+    'card': ((600, 600), True),
+    'zoom': ((1600, 1600), False),
+}
+
+
+def output_format():
+    if features.check('webp'):
+        return 'WEBP', 'webp'
+    return 'JPEG', 'jpg'
+
+
+def render_variants(data):
+    """
+    Encode every variant of the image in `data`. Returns
+    `{name: (encoded bytes, file extension)}`.
+    """
+    fmt, ext = output_format()
+    with Image.open(BytesIO(data)) as source:
+        source = ImageOps.exif_transpose(source)
+        keep_alpha = fmt == 'WEBP' and source.mode in ('RGBA', 'LA', 'P')
+        source = source.convert('RGBA' if keep_alpha else 'RGB')
+
+        rendered = {}
+        for name, (size, crop) in VARIANTS.items():
+            if crop:
+                image = ImageOps.fit(source, size, Image.Resampling.LANCZOS)
+            else:
+                image = source.copy()
+                image.thumbnail(size, Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            if fmt == 'WEBP':
+                image.save(buffer, fmt, quality=80, method=4)
+            else:
+                image.save(buffer, fmt, quality=82, optimize=True, progressive=True)
+            rendered[name] = (buffer.getvalue(), ext)
+    return rendered
@@ -0,0 +1,360 @@
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Category, Inventory, Product, ProductVariant, Tag
+from .signals import products_bulk_changed
+
+CHUNK_SIZE = 1000
+
+# Only the first few failures are kept so a broken feed can't grow the report
+# without bound.
+MAX_REPORTED_ERRORS = 100
+
+CONDITIONS = {value for value, _ in Product.CONDITION_CHOICES}
+LABELS = {value for value, _ in Product._meta.get_field('label').choices} | {''}
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', ''}
+
+PRODUCT_FIELDS = ['name', 'description', 'price', 'condition', 'label', 'is_active', 'category']
+
+# Every row has these. The others only overwrite an existing product when the
+# row has them (any row of a CSV with the column), so a feed that leaves out
+# a column leaves it as it is.
+REQUIRED_FIELDS = ('name', 'price', 'condition')
+
+
+class RowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: list = field(default_factory=list)
+    elapsed: float = 0.0
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.failed
+
+    @property
+    def rows_per_second(self):
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def detect_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(binary_file, fmt):
+    """
+    Yield `(line_number, row)` pairs from a CSV or JSON-lines byte stream one
+    record at a time, so memory use doesn't depend on the file size.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, RowError(f'invalid JSON: {exc}')
+                continue
+            yield line_number, row if isinstance(row, dict) else RowError('expected a JSON object')
+
+
+def _text(row, key, max_length, required=False):
+    value = row.get(key)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f'{key} is required')
+    if len(value) > max_length:
+        raise RowError(f'{key} is longer than {max_length} characters')
+    return value
+
+
+def _decimal(row, key, default=None):
+    value = row.get(key)
+    if value in (None, ''):
+        if default is None:
+            raise RowError(f'{key} is required')
+        return default
+    try:
+        number = Decimal(str(value)).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f'{key} is not a number')
+    if number < 0 or number >= Decimal('1e8'):
+        raise RowError(f'{key} is out of range')
+    return number
+
+
+def _integer(row, key):
+    value = row.get(key)
+    if value in (None, ''):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise RowError(f'{key} is not a whole number')
+    if number < 0:
+        raise RowError(f'{key} must not be negative')
+    return number
+
+
+def _boolean(row, key, default):
+    value = row.get(key)
+    if value is None or isinstance(value, bool):
+        return default if value is None else value
+    value = str(value).strip().lower()
+    if value in TRUE_VALUES:
+        return True
+    if value in FALSE_VALUES:
+        return False
+    raise RowError(f'{key} is not a boolean')
+
+
+def _list(row, key):
+    """
+    JSON arrays pass through; CSV cells are either JSON or `|`-separated.
+    """
+    value = row.get(key)
+    if value in (None, ''):
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        if value.startswith('['):
+            try:
+                value = json.loads(value)
+            except ValueError:
+                raise RowError(f'{key} is not valid JSON')
+        else:
+            value = [part.strip() for part in value.split('|') if part.strip()]
+    if not isinstance(value, list):
+        raise RowError(f'{key} must be a list')
+    return value
+
+
+def clean_row(row):
+    condition = _text(row, 'condition', 20, required=True).lower()
+    if condition not in CONDITIONS:
+        raise RowError(f'condition must be one of {", ".join(sorted(CONDITIONS))}')
+    label = _text(row, 'label', 20).lower()
+    if label not in LABELS:
+        raise RowError(f'label must be one of {", ".join(sorted(LABELS - {""}))} or empty')
+
+    variants = []
+    for variant in _list(row, 'variants') or []:
+        if not isinstance(variant, dict):
+            raise RowError('each variant must be an object')
+        variants.append({
+            'color': _text(variant, 'color', 30),
+            'size': _text(variant, 'size', 10),
+            'price_difference': _decimal(variant, 'price_difference', Decimal('0.00')),
+        })
+
+    tags = _list(row, 'tags')
+    if tags is not None:
+        tags = sorted({str(tag).strip()[:50] for tag in tags if str(tag).strip()})
+
+    return {
+        'sku': _text(row, 'sku', 50, required=True),
+        'name': _text(row, 'name', 200, required=True),
+        'description': _text(row, 'description', 1_000_000),
+        'price': _decimal(row, 'price'),
+        'condition': condition,
+        'label': label,
+        'is_active': _boolean(row, 'is_active', True),
+        'category': _text(row, 'category', 50) or None,
+        'quantity': _integer(row, 'quantity'),
+        'low_stock_threshold': _integer(row, 'low_stock_threshold'),
+        'tags': tags,
+        'variants': variants if row.get('variants') not in (None, '') else None,
+        'fields': tuple(name for name in PRODUCT_FIELDS if name in REQUIRED_FIELDS or name in row),
+    }
+
+
+class ProductImporter:
+    """
+    Upserts products by SKU in chunks. Each chunk is one transaction made of a
+    handful of set-based statements (an INSERT ... ON CONFLICT for the
+    products per set of columns the rows carry, so one for a CSV, then bulk
+    writes for inventory, tags and variants), whatever the number of rows in
+    it.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE, progress=None):
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.categories = {}
+        self.tags = {}
+
+    def run(self, rows):
+        result = ImportResult()
+        started = time.monotonic()
+        chunk = {}
+        for line_number, row in rows:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                cleaned = clean_row(row)
+            except RowError as exc:
+                self._fail(result, line_number, exc)
+                continue
+            # A SKU repeated inside one chunk: the last row wins.
+            chunk[cleaned['sku']] = (line_number, cleaned)
+            if len(chunk) >= self.chunk_size:
+                self._flush(chunk, result)
+                chunk = {}
+                self._report(result, started)
+        if chunk:
+            self._flush(chunk, result)
+        result.elapsed = time.monotonic() - started
+        self._report(result, started)
+        return result
+
+    def _fail(self, result, line_number, exc):
+        result.failed += 1
+        if len(result.errors) < MAX_REPORTED_ERRORS:
+            result.errors.append({'line': line_number, 'error': str(exc)})
+
+    def _report(self, result, started):
+        if self.progress:
+            result.elapsed = time.monotonic() - started
+            self.progress(result)
+
+    def _resolve_categories(self, chunk, result):
+        slugs = {row['category'] for _, row in chunk.values() if row['category']} - self.categories.keys()
+        if slugs:
+            self.categories.update(Category.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+        for sku, (line_number, row) in list(chunk.items()):
+            if row['category'] and row['category'] not in self.categories:
+                self._fail(result, line_number, RowError(f"unknown category '{row['category']}'"))
+                del chunk[sku]
+
+    def _resolve_tags(self, chunk):
+        names = {name for _, row in chunk.values() for name in row['tags'] or ()} - self.tags.keys()
+        if not names:
+            return
+        for pk, name in Tag.objects.filter(name__in=names).order_by('pk').values_list('pk', 'name'):
+            self.tags.setdefault(name, pk)
+        missing = names - self.tags.keys()
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in missing])
+            for pk, name in Tag.objects.filter(name__in=missing).values_list('pk', 'name'):
+                self.tags.setdefault(name, pk)
+
+    def _flush(self, chunk, result):
+        with transaction.atomic():
+            self._resolve_categories(chunk, result)
+            if not chunk:
+                return
+            self._resolve_tags(chunk)
+            skus = list(chunk)
+            existing = set(Product.objects.filter(sku__in=skus).values_list('sku', flat=True))
+
+            by_fields = {}
+            for sku, (_, row) in chunk.items():
+                by_fields.setdefault(row['fields'], []).append(Product(
+                    sku=sku,
+                    name=row['name'],
+                    description=row['description'],
+                    price=row['price'],
+                    condition=row['condition'],
+                    label=row['label'],
+                    is_active=row['is_active'],
+                    category_id=self.categories.get(row['category']),
+                ))
+            for fields, products in by_fields.items():
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['sku'],
+                    update_fields=[name if name != 'category' else 'category_id' for name in fields] + ['updated_at'],
+                )
+            ids = dict(Product.objects.filter(sku__in=skus).values_list('sku', 'pk'))
+            rows = [(ids[sku], row) for sku, (_, row) in chunk.items()]
+
+            self._write_inventory(rows)
+            self._write_tags(rows)
+            self._write_variants(rows)
+
+            result.updated += len(existing)
+            result.created += len(chunk) - len(existing)
+            products_bulk_changed.send(sender=Product, product_ids=list(ids.values()))
+
+    def _write_inventory(self, rows):
+        stock = {pk: row for pk, row in rows if row['quantity'] is not None or row['low_stock_threshold'] is not None}
+        if not stock:
+            return
+        existing = {inv.product_id: inv for inv in Inventory.objects.filter(product_id__in=stock)}
+        inventories = []
+        for pk, row in stock.items():
+            inventory = existing.get(pk) or Inventory(product_id=pk)
+            if row['quantity'] is not None:
+                inventory.quantity = row['quantity']
+            if row['low_stock_threshold'] is not None:
+                inventory.low_stock_threshold = row['low_stock_threshold']
+            inventories.append(Inventory(
+                product_id=pk,
+                quantity=inventory.quantity,
+                low_stock_threshold=inventory.low_stock_threshold,
+            ))
+        # bulk_update() would build a CASE WHEN per row; upserting on the
+        # one-to-one product column is a single statement.
+        Inventory.objects.bulk_create(
+            inventories,
+            update_conflicts=True,
+            unique_fields=['product'],
+            update_fields=['quantity', 'low_stock_threshold'],
+        )
+
+    def _write_tags(self, rows):
+        tagged = {pk: row['tags'] for pk, row in rows if row['tags'] is not None}
+        if not tagged:
+            return
+        through = Product.tags.through
+        through.objects.filter(product_id__in=tagged).delete()
+        through.objects.bulk_create([
+            through(product_id=pk, tag_id=self.tags[name])
+            for pk, names in tagged.items()
+            for name in names
+        ], ignore_conflicts=True)
+
+    def _write_variants(self, rows):
+        varied = {pk: row['variants'] for pk, row in rows if row['variants'] is not None}
+        if not varied:
+            return
+        ProductVariant.objects.filter(product_id__in=varied).delete()
+        ProductVariant.objects.bulk_create([
+            ProductVariant(product_id=pk, **variant)
+            for pk, variants in varied.items()
+            for variant in variants
+        ])
+
+
+def import_products(binary_file, fmt, chunk_size=CHUNK_SIZE, progress=None):
+    importer = ProductImporter(chunk_size=chunk_size, progress=progress)
+    return importer.run(read_rows(binary_file, fmt))
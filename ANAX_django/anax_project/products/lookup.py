@@ -0,0 +1,116 @@
+"""
+Batch SKU lookup for tills: price, stock and primary image for a burst of
+scanned SKUs from one indexed IN query, with the hottest SKUs answered from
+an in-process LRU.
+
+LRU entries carry the product's detail-cache version (products.detail_cache)
+and are only served while it is unchanged, so price and stock edits from any
+process take effect on the next scan.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.db.models import OuterRef, Subquery
+
+from . import cache as versions
+from . import detail_cache
+
+LRU_SIZE = 4096
+MAX_SKUS = 500
+
+# Record key -> lookup, one row per product.
+FIELDS = {
+    'id': 'id',
+    'sku': 'sku',
+    'name': 'name',
+    'price': 'price',
+    'is_active': 'is_active',
+    'quantity': 'inventory__quantity',
+    'image': 'image',
+}
+
+Entry = namedtuple('Entry', 'pk version record')
+
+
+class LRU:
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_entries = LRU(LRU_SIZE)
+
+
+def records(queryset, fields=FIELDS):
+    """
+    Compact dicts for a product queryset in a single query: price as a
+    string, stock from Inventory (0 without a row) and the primary image's
+    stored name.
+    """
+    from .models import ProductImage
+
+    primary_image = ProductImage.objects.filter(product=OuterRef('pk')).order_by('-is_primary', 'pk')
+    rows = queryset.annotate(image=Subquery(primary_image.values('image')[:1])).values_list(*fields.values())
+    for values in rows:
+        record = dict(zip(fields, values))
+        record['price'] = str(record['price'])
+        record['quantity'] = record['quantity'] or 0
+        yield record
+
+
+def fetch(skus):
+    """
+    `{sku: record}` for the given SKUs in one query on the unique sku index.
+    """
+    from .models import Product
+
+    return {record['sku']: record for record in records(Product.objects.filter(sku__in=skus))}
+
+
+def lookup(skus):
+    """
+    `{sku: record}` for every SKU that exists. Versions are read before the
+    query so a change committed meanwhile is never cached as current; a SKU
+    seen for the first time is cached unverified and only served from the
+    LRU once a later lookup has confirmed its version.
+    """
+    skus = list(dict.fromkeys(skus))
+    cached = {sku: _entries.get(sku) for sku in skus}
+    known = {sku: entry for sku, entry in cached.items() if entry is not None}
+    current = versions.get_versions(detail_cache.version_name(entry.pk) for entry in known.values())
+
+    found = {}
+    for sku, entry in known.items():
+        if entry.version is not None and entry.version == current[detail_cache.version_name(entry.pk)]:
+            found[sku] = entry.record
+
+    misses = [sku for sku in skus if sku not in found]
+    if misses:
+        for sku, record in fetch(misses).items():
+            version = current.get(detail_cache.version_name(record['id']))
+            _entries.put(sku, Entry(record['id'], version, record))
+            found[sku] = record
+    return found
+
+
+def clear():
+    _entries.clear()
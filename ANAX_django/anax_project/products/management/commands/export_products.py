@@ -0,0 +1,25 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from products import exporters
+
+
+class Command(BaseCommand):
+    help = "Stream the product catalog as CSV or newline-delimited JSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=['csv', 'ndjson'], default='ndjson')
+        parser.add_argument('--output', help="File to write to. Defaults to stdout.")
+
+    def handle(self, *args, **options):
+        if options['output']:
+            target = open(options['output'], 'w', encoding='utf-8', newline='')
+        else:
+            target = sys.stdout
+        try:
+            for chunk in exporters.iter_export(options['format']):
+                target.write(chunk)
+        finally:
+            if target is not sys.stdout:
+                target.close()
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+
+from products import derivatives, imaging
+from products.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = "Render thumb/card/zoom variants for product images that don't have them yet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Regenerate every image's variants.")
+        parser.add_argument('--workers', type=int, help="Worker processes. Defaults to half the CPUs.")
+        parser.add_argument('--batch-size', type=int, default=32)
+
+    def handle(self, *args, **options):
+        images = ProductImage.objects.exclude(image='').order_by('pk')
+        done = failed = 0
+        last_pk = 0
+        with derivatives.make_executor(options['workers']) as executor:
+            while True:
+                # Keyset batches rather than one open cursor, since every
+                # batch writes back to the table being walked.
+                batch = list(images.filter(pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                last_pk = batch[-1].pk
+                pending = [image for image in batch if options['force'] or not derivatives.is_current(image)]
+                if pending:
+                    ok, bad = self.process(executor, pending)
+                    done, failed = done + ok, failed + bad
+                    self.stdout.write(f"{done} images processed", ending='\r')
+
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(f"Generated variants for {done} images, {failed} failed."))
+
+    def process(self, executor, batch):
+        sources = []
+        for image in batch:
+            try:
+                sources.append((image, derivatives.read_source(image)))
+            except OSError as exc:
+                self.stderr.write(f"image {image.pk}: {exc}")
+        futures = [(image, executor.submit(imaging.render_variants, data)) for image, data in sources]
+        ok = 0
+        for image, future in futures:
+            try:
+                derivatives.store(image, future.result())
+                ok += 1
+            except Exception as exc:
+                self.stderr.write(f"image {image.pk}: {exc}")
+        return ok, len(batch) - ok
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import importers
+
+
+class Command(BaseCommand):
+    help = "Upsert products by SKU from a CSV or JSON-lines file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file to import.")
+        parser.add_argument(
+            '--format', choices=['csv', 'jsonl'],
+            help="File format. Guessed from the extension when omitted.",
+        )
+        parser.add_argument('--chunk-size', type=int, default=importers.CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or importers.detect_format(options['path'])
+        try:
+            source = open(options['path'], 'rb')
+        except OSError as exc:
+            raise CommandError(exc)
+
+        def progress(result):
+            self.stdout.write(
+                f"{result.processed} rows ({result.rows_per_second:.0f} rows/sec)", ending='\r',
+            )
+
+        with source:
+            result = importers.import_products(
+                source, fmt, chunk_size=options['chunk_size'], progress=progress,
+            )
+
+        self.stdout.write('')
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result.created}, updated {result.updated}, failed {result.failed} "
+            f"in {result.elapsed:.1f}s ({result.rows_per_second:.0f} rows/sec)."
+        ))
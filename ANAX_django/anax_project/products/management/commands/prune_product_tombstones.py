@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from products import changes
+
+
+class Command(BaseCommand):
+    help = "Delete product tombstones older than the sync retention window. Meant to run from cron."
+
+    def handle(self, *args, **options):
+        deleted = changes.prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(f"Pruned {deleted} product tombstones."))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text product search index from scratch."
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("Full-text search requires the SQLite backend.")
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS("Product search index rebuilt."))
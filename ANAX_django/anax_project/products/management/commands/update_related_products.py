@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products import related
+
+
+class Command(BaseCommand):
+    help = "Recompute related products for products whose tags or category changed. Meant to run from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Recompute every product, not just queued ones.")
+        parser.add_argument('--batch-size', type=int, default=related.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['full']:
+            written = related.rebuild(options['batch_size'])
+        else:
+            written = related.update_stale(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Updated related products for {written} products in {time.monotonic() - started:.1f}s."
+        ))
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts USING fts5("
+        "name, description, sku, tags, category, "
+        "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+    )
+    schema_editor.execute(
+        "INSERT INTO products_product_fts (rowid, name, description, sku, tags, category) "
+        "SELECT p.id, p.name, p.description, p.sku, "
+        "COALESCE((SELECT group_concat(t.name, ' ') FROM products_product_tags pt "
+        "JOIN products_tag t ON t.id = pt.tag_id WHERE pt.product_id = p.id), ''), "
+        "COALESCE(c.name, '') "
+        "FROM products_product p LEFT JOIN products_category c ON c.id = p.category_id"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS products_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_alter_product_created_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from products.fuzzy import trigrams
+
+
+def backfill_trigrams(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductTrigram = apps.get_model('products', 'ProductTrigram')
+    rows = (
+        ProductTrigram(product_id=pk, trigram=gram)
+        for pk, name, sku in Product.objects.values_list('pk', 'name', 'sku').iterator()
+        for gram in trigrams(name) | trigrams(sku)
+    )
+    ProductTrigram.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['trigram', 'product'], name='products_trigram_lookup_idx')],
+                'unique_together': {('product', 'trigram')},
+            },
+        ),
+        migrations.RunPython(backfill_trigrams, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.7 on 2026-10-18 06:57
+
+from django.db import migrations, models
+import products.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_productimage_derivatives'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(db_index=True, storage=products.storage.product_image_storage, upload_to='products/'),
+        ),
+    ]
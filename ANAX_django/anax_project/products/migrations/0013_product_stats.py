@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def create_stats_rows(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductStats = apps.get_model('products', 'ProductStats')
+    ProductStats.objects.bulk_create(
+        (ProductStats(product_id=pk) for pk in Product.objects.values_list('pk', flat=True).iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0012_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='products.product')),
+                ('views', models.PositiveBigIntegerField(default=0)),
+                ('popularity', models.FloatField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['popularity', 'product'], name='products_stats_popular_idx'), models.Index(fields=['views', 'product'], name='products_stats_views_idx')],
+            },
+        ),
+        migrations.RunPython(create_stats_rows, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0013_product_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productstats',
+            name='sold_30d',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productstats',
+            name='sold_7d',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='productstats',
+            name='sold_90d',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productstats',
+            index=models.Index(fields=['sold_7d', 'product'], name='products_stats_sold_7d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productstats',
+            index=models.Index(fields=['sold_30d', 'product'], name='products_stats_sold_30d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productstats',
+            index=models.Index(fields=['sold_90d', 'product'], name='products_stats_sold_90d_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 07:47
+
+from collections import Counter
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    ProductImage = apps.get_model('products', 'ProductImage')
+    StoredImage = apps.get_model('products', 'StoredImage')
+    counts = Counter()
+    for image, derivatives in ProductImage.objects.values_list('image', 'derivatives').iterator():
+        counts[image] += 1
+        source = (derivatives or {}).get('source')
+        if source and source != image:
+            counts[source] += 1
+    StoredImage.objects.bulk_create(
+        (StoredImage(name=name, references=references) for name, references in counts.items() if name),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0015_product_search_document'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredImage',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('references', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
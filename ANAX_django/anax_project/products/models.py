@@ -1,13 +1,73 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+from django.utils import timezone
+
+from . import cache
+from .storage import product_image_storage
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True)
     parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.SET_NULL)
+    # Materialized path of ancestor ids including our own, e.g. "/1/5/12/".
+    # A subtree is the range [path, path[:-1] + "0") on the indexed column.
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            old_path = self.path
+            super().save(*args, **kwargs)
+            parent_path, parent_depth = '/', -1
+            if self.parent_id:
+                parent_path, parent_depth = Category.objects.values_list('path', 'depth').get(pk=self.parent_id)
+                if old_path and parent_path.startswith(old_path):
+                    raise ValueError("A category can't be moved under its own descendant.")
+            path = f'{parent_path}{self.pk}/'
+            if path != old_path:
+                Category.objects.filter(pk=self.pk).update(path=path, depth=parent_depth + 1)
+                if old_path:
+                    Category.rewrite_subtree(old_path, path, parent_depth + 1 - self.depth)
+                self.path, self.depth = path, parent_depth + 1
+
+    @staticmethod
+    def rewrite_subtree(old_prefix, new_prefix, depth_change):
+        """
+        Re-root every strict descendant of `old_prefix` under `new_prefix` in
+        a single UPDATE.
+        """
+        Category.objects.filter(
+            path__gt=old_prefix, path__lt=Category.subtree_upper_bound(old_prefix),
+        ).update(
+            path=Concat(Value(new_prefix), Substr('path', len(old_prefix) + 1)),
+            depth=models.F('depth') + depth_change,
+        )
+
+    @staticmethod
+    def subtree_upper_bound(path):
+        # '0' sorts right after '/', so this bounds every path under `path`.
+        return path[:-1] + '0'
 
 class Tag(models.Model):
     name = models.CharField(max_length=50)
 
+class ProductQuerySet(models.QuerySet):
+    def with_relations(self):
+        # Everything ProductSerializer touches, loaded in a fixed number of
+        # queries regardless of how many products are returned.
+        return self.select_related('category').prefetch_related('images', 'tags')
+
+    def touch(self):
+        # Mark products changed when only their related rows were, so
+        # updated_at-based validators and syncs, and the list ETags keyed
+        # on the catalog version, still see the change.
+        transaction.on_commit(lambda: cache.bump_version('catalog'))
+        return self.update(updated_at=timezone.now())
+
 class Product(models.Model):
     CONDITION_CHOICES = [
         ('new', 'New'),
@@ -18,7 +78,8 @@ class Product(models.Model):
     name = models.CharField(max_length=200)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    # Indexed as the leading column of the composite indexes below.
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, db_index=False)
     condition = models.CharField(max_length=20, choices=CONDITION_CHOICES)
     sku = models.CharField(max_length=50, unique=True)
     label = models.CharField(max_length=20, choices=[('new', 'New'), ('sale', 'Sale')], blank=True)
@@ -27,10 +88,57 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProductQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (created_at, id).
+            models.Index(fields=['created_at', 'id'], name='products_created_id_idx'),
+            # ProductListAPIView: ?category= and ?price__gte/lte= with either
+            # ordering, each one an index range scan in page order.
+            models.Index(fields=['category', 'created_at', 'id'], name='products_cat_created_idx'),
+            models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='products_cat_price_idx'),
+            # The storefront asks for ?is_active=true; Django renders that as
+            # a bare `WHERE is_active`, which these partial indexes match.
+            models.Index(
+                fields=['created_at', 'id'], condition=models.Q(is_active=True),
+                name='products_active_created_idx',
+            ),
+            models.Index(
+                fields=['category', 'created_at', 'id'], condition=models.Q(is_active=True),
+                name='products_active_cat_idx',
+            ),
+            # The delta-sync feed seeks on (updated_at, id), see products.changes.
+            models.Index(fields=['updated_at', 'id'], name='products_updated_id_idx'),
+        ]
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='products/')
+    # Content-addressed: identical uploads share one file, see products.storage.
+    image = models.ImageField(upload_to='products/', storage=product_image_storage, db_index=True)
     is_primary = models.BooleanField(default=False)
+    # Resized variants, e.g. {"source": <original name>, "thumb": <name>, ...};
+    # filled in after upload by products.derivatives.
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
+
+    def save(self, *args, **kwargs):
+        from . import derivatives
+
+        # A new upload is a reference to its (possibly shared) stored file.
+        upload = None if self.image._committed else self.image.file
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if upload is not None:
+                derivatives.retain(self.image.name, upload, self.image.storage)
+
+class StoredImage(models.Model):
+    # Reference count of a content-addressed original: one per ProductImage
+    # using it as `image`, plus one per image whose variants still come from
+    # it. Changed in the transaction that adds or drops the reference, which
+    # serializes uploads against deletes; see products.derivatives.
+    name = models.CharField(max_length=255, primary_key=True)
+    references = models.IntegerField(default=0)
 
 class ProductVariant(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='variants')
@@ -42,3 +150,77 @@ class Inventory(models.Model):
     product = models.OneToOneField(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=0)
     low_stock_threshold = models.PositiveIntegerField(default=5)
+
+class ProductSearchDocument(models.Model):
+    # The FTS5 index built by products.search, mapped so product querysets
+    # can join it on rowid. Written only through products.search.
+    product = models.OneToOneField(
+        Product, primary_key=True, db_column='rowid', db_constraint=False,
+        on_delete=models.DO_NOTHING, related_name='search_document',
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'products_product_fts'
+
+class ProductTrigram(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = ('product', 'trigram')
+        indexes = [
+            models.Index(fields=['trigram', 'product'], name='products_trigram_lookup_idx'),
+        ]
+
+class RelatedProduct(models.Model):
+    # Top-N neighbours by shared tags and category, written by
+    # products.related; `rank` 0 is the closest.
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_products')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('product', 'rank')
+
+class RelatedProductQueue(models.Model):
+    # Products whose tags or category changed since their related products
+    # were last computed; drained by `manage.py update_related_products`.
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True)
+
+class ProductTombstone(models.Model):
+    # A deleted product, kept so offline replicas syncing from
+    # products.changes learn to drop it; pruned after TOMBSTONE_RETENTION.
+    product_id = models.BigIntegerField()
+    sku = models.CharField(max_length=50)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='products_tombstone_seek_idx'),
+        ]
+
+class ProductStats(models.Model):
+    # View counters, written in batches by products.popularity. Every
+    # product has a row, so sorting by them is an inner join that walks
+    # these indexes in page order.
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    views = models.PositiveBigIntegerField(default=0)
+    # Views weighted by 2 ** (age / HALF_LIFE) from a fixed epoch, so
+    # comparing scores compares exponentially decayed view counts.
+    popularity = models.FloatField(default=0)
+    # Units sold in paid orders placed in the last 7/30/90 days, written by
+    # orders.best_sellers.
+    sold_7d = models.PositiveIntegerField(default=0)
+    sold_30d = models.PositiveIntegerField(default=0)
+    sold_90d = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['popularity', 'product'], name='products_stats_popular_idx'),
+            models.Index(fields=['views', 'product'], name='products_stats_views_idx'),
+            models.Index(fields=['sold_7d', 'product'], name='products_stats_sold_7d_idx'),
+            models.Index(fields=['sold_30d', 'product'], name='products_stats_sold_30d_idx'),
+            models.Index(fields=['sold_90d', 'product'], name='products_stats_sold_90d_idx'),
+        ]
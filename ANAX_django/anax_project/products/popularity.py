@@ -0,0 +1,135 @@
+"""
+Product view counters for "most viewed" and "trending" sorting.
+
+A view only bumps an in-process counter; a background thread flushes the
+aggregated deltas every PRODUCT_STATS_FLUSH_INTERVAL seconds as one batched
+upsert into ProductStats, so a burst of views costs one write per process
+per interval instead of one per request. The WSGI/ASGI entry points enable
+the thread, and each serving process starts its own on the first view it
+records, so workers forked after the app is loaded get one too.
+
+Trending uses a decay that never rewrites old rows: each view adds
+2 ** ((now - EPOCH) / HALF_LIFE) to `popularity`, so later views weigh
+more, and comparing two scores at any moment gives the same answer as
+comparing their exponentially decayed view counts.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import cache
+
+logger = logging.getLogger(__name__)
+
+# Floats overflow at 2 ** 1024, i.e. 1024 half-lives (about 19 years at
+# seven days) after EPOCH; move it forward and rescale before then.
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=7)
+
+# Flush early, from the recording thread, once this many products are
+# pending, e.g. in a process that never enabled the flusher.
+MAX_PENDING = 10000
+
+# Bumped whenever ProductStats is written (here and by orders.best_sellers)
+# so list ETags for orderings by it change.
+VERSION_NAME = 'product_stats'
+
+_pending = Counter()
+_lock = threading.Lock()
+# Set by enable_flusher(); _flusher_pid is the process whose thread is running.
+_interval = 0
+_flusher_pid = None
+_stopped = threading.Event()
+
+
+def weight(moment=None):
+    return 2 ** (((moment or timezone.now()) - EPOCH) / HALF_LIFE)
+
+
+def record_view(product_id):
+    if _interval and _flusher_pid != os.getpid():
+        _start_flusher()
+    with _lock:
+        _pending[product_id] += 1
+        overflowing = len(_pending) >= MAX_PENDING
+    if overflowing:
+        flush()
+
+
+def flush():
+    """
+    Write every pending count in one statement and return how many products
+    it covered. Counts that fail to write are put back for the next flush.
+    """
+    from .models import Product, ProductStats
+
+    global _pending
+    with _lock:
+        pending, _pending = _pending, Counter()
+    if not pending:
+        return 0
+
+    score = weight()
+    table = connection.ops.quote_name(ProductStats._meta.db_table)
+    products = connection.ops.quote_name(Product._meta.db_table)
+    # Selecting from products skips any deleted since they were viewed.
+    sql = (
+        f"INSERT INTO {table} (product_id, views, popularity, sold_7d, sold_30d, sold_90d) "
+        f"SELECT id, %s, %s, 0, 0, 0 FROM {products} WHERE id = %s "
+        f"ON CONFLICT (product_id) DO UPDATE SET "
+        f"views = {table}.views + excluded.views, popularity = {table}.popularity + excluded.popularity"
+    )
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(sql, [(count, count * score, pk) for pk, count in pending.items()])
+    except Exception:
+        logger.exception("Could not flush view counts for %s products", len(pending))
+        with _lock:
+            _pending.update(pending)
+        return 0
+    cache.bump_version(VERSION_NAME)
+    return len(pending)
+
+
+def _run(interval):
+    while not _stopped.wait(interval):
+        try:
+            flush()
+        finally:
+            connection.close()
+
+
+def _shutdown():
+    _stopped.set()
+    flush()
+
+
+def enable_flusher(interval=None):
+    """
+    Flush from a background thread in this process and any forked from it,
+    each starting its own on the first view it records. Does nothing when
+    the interval is 0, leaving flush() to the caller.
+    """
+    global _interval
+    _interval = getattr(settings, 'PRODUCT_STATS_FLUSH_INTERVAL', 5) if interval is None else interval
+
+
+def _start_flusher():
+    global _flusher_pid
+    with _lock:
+        pid = os.getpid()
+        if _flusher_pid == pid:
+            return
+        if _flusher_pid is not None:
+            # Forked from a process with counts pending; it flushes those.
+            _pending.clear()
+        _flusher_pid = pid
+        threading.Thread(target=_run, args=(_interval,), name='product-stats-flusher', daemon=True).start()
+    atexit.register(_shutdown)
@@ -0,0 +1,232 @@
+"""
+"Related products" from shared tags and category.
+
+Every active product is a row of a sparse feature matrix with one column per
+tag and per category, L2-normalised, so `X[rows] @ X.T` gives the cosine
+similarity of those rows against the whole catalog in one sparse product.
+Only the top TOP_N per product are kept, in the RelatedProduct table.
+"""
+import numpy as np
+from scipy import sparse
+
+from core.batch import chunked, claim, enqueue, replace_rows
+
+TOP_N = 12
+BATCH_SIZE = 500
+
+# Tags on more than this share of the catalog ("new", "sale") say little
+# about similarity but would make every batch product dense.
+MAX_FEATURE_SHARE = 0.2
+MIN_FEATURE_LIMIT = 50
+
+# Past this share of the catalog queued, recomputing everything is cheaper
+# than working out who is affected.
+FULL_REBUILD_SHARE = 0.25
+
+CATEGORY_WEIGHT = 1.0
+TAG_WEIGHT = 1.0
+
+
+class Features:
+    """
+    The normalised product x feature matrix and the product id of each row.
+    """
+
+    def __init__(self, product_ids, matrix):
+        self.product_ids = product_ids
+        self.matrix = matrix
+
+    @classmethod
+    def load(cls):
+        from .models import Product
+
+        active = Product.objects.filter(is_active=True)
+        product_ids = np.fromiter(active.order_by('pk').values_list('pk', flat=True), dtype=np.int64)
+        tag_pairs = np.array(
+            list(Product.tags.through.objects.filter(product__is_active=True).values_list('product_id', 'tag_id')),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        category_pairs = np.array(
+            list(active.filter(category__isnull=False).values_list('pk', 'category_id')),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+
+        tag_ids, tag_columns = np.unique(tag_pairs[:, 1], return_inverse=True)
+        category_ids, category_columns = np.unique(category_pairs[:, 1], return_inverse=True)
+        rows = np.concatenate([
+            np.searchsorted(product_ids, tag_pairs[:, 0]),
+            np.searchsorted(product_ids, category_pairs[:, 0]),
+        ])
+        columns = np.concatenate([tag_columns.ravel(), category_columns.ravel() + len(tag_ids)])
+        weights = np.concatenate([
+            np.full(len(tag_pairs), TAG_WEIGHT, dtype=np.float32),
+            np.full(len(category_pairs), CATEGORY_WEIGHT, dtype=np.float32),
+        ])
+        matrix = sparse.csr_matrix(
+            (weights, (rows, columns)),
+            shape=(len(product_ids), len(tag_ids) + len(category_ids)),
+        )
+
+        limit = max(MIN_FEATURE_LIMIT, MAX_FEATURE_SHARE * len(product_ids))
+        matrix = matrix[:, np.flatnonzero(matrix.getnnz(axis=0) <= limit)]
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return cls(product_ids, (sparse.diags(1 / norms) @ matrix).astype(np.float32).tocsr())
+
+    def rows_for(self, product_ids):
+        """
+        Row numbers of the given products, skipping inactive or unknown ones.
+        """
+        product_ids = np.asarray(sorted(product_ids), dtype=np.int64)
+        rows = np.searchsorted(self.product_ids, product_ids)
+        rows = rows[rows < len(self.product_ids)]
+        return rows[np.isin(self.product_ids[rows], product_ids)]
+
+    def similarities(self, rows):
+        """
+        Sparse (len(rows) x catalog) cosine similarities, self-matches removed.
+        """
+        scores = (self.matrix[rows] @ self.matrix.T).tocsr()
+        entry_rows = np.repeat(np.asarray(rows), np.diff(scores.indptr))
+        scores.data[scores.indices == entry_rows] = 0
+        scores.eliminate_zeros()
+        return scores
+
+
+def top_n(scores, row_ids, column_ids, n=TOP_N):
+    """
+    `{row_id: [(column_id, score), ...]}` with the n best columns of each row
+    of a sparse score matrix, best first, ties broken by id so results are
+    stable.
+    """
+    scores = scores.tocsr()
+    results = {}
+    for i, row_id in enumerate(row_ids):
+        start, end = scores.indptr[i], scores.indptr[i + 1]
+        columns, values = scores.indices[start:end], scores.data[start:end]
+        if len(values) > n:
+            best = np.argpartition(-values, n)[:n]
+            columns, values = columns[best], values[best]
+        ids = column_ids[columns]
+        order = np.lexsort((ids, -values))
+        results[int(row_id)] = [(int(ids[j]), float(values[j])) for j in order]
+    return results
+
+
+def top_related(features, rows, n=TOP_N):
+    return top_n(features.similarities(rows), features.product_ids[rows], features.product_ids, n)
+
+
+def store(results):
+    """
+    Replace the stored rows of every product in `results`. Rows go in
+    through executemany; a full rebuild writes TOP_N per product.
+    """
+    from .models import RelatedProduct
+
+    rows = [
+        (product_id, related_id, rank, score)
+        for product_id, related in results.items()
+        for rank, (related_id, score) in enumerate(related)
+    ]
+    replace_rows(RelatedProduct, 'product_id', results, ('product_id', 'related_id', 'rank', 'score'), rows)
+
+
+def compute(features, product_ids, batch_size=BATCH_SIZE):
+    """
+    Recompute and store the given products' rows in batches; products that
+    are no longer active lose theirs. Returns how many were written.
+    """
+    from .models import RelatedProduct
+
+    product_ids = list(product_ids)
+    rows = features.rows_for(product_ids)
+    inactive = set(product_ids) - set(features.product_ids[rows].tolist())
+    for chunk in chunked(inactive):
+        RelatedProduct.objects.filter(product_id__in=chunk).delete()
+    for start in range(0, len(rows), batch_size):
+        store(top_related(features, rows[start:start + batch_size]))
+    return len(rows)
+
+
+def _recompute_all(features, batch_size):
+    from .models import RelatedProduct
+
+    RelatedProduct.objects.exclude(product__is_active=True).delete()
+    return compute(features, features.product_ids.tolist(), batch_size)
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """
+    Recompute every active product from scratch, clearing whatever was
+    queued before it started.
+    """
+    from .models import RelatedProductQueue
+
+    with claim(RelatedProductQueue):
+        return _recompute_all(Features.load(), batch_size)
+
+
+def affected_products(features, changed_ids, batch_size=BATCH_SIZE):
+    """
+    The changed products plus every product whose top N they may have
+    entered or left: those listing them now, and those they now score above
+    the current cut-off for.
+    """
+    from django.db.models import Count, Min
+
+    from .models import RelatedProduct
+
+    affected = set(changed_ids)
+    for chunk in chunked(changed_ids):
+        affected.update(
+            RelatedProduct.objects.filter(related_id__in=chunk).values_list('product_id', flat=True)
+        )
+
+    rows = features.rows_for(changed_ids)
+    best = np.zeros(len(features.product_ids))
+    for start in range(0, len(rows), batch_size):
+        scores = features.similarities(rows[start:start + batch_size]).max(axis=0)
+        best = np.maximum(best, scores.toarray().ravel())
+    candidates = dict(zip(features.product_ids[best > 0].tolist(), best[best > 0].tolist()))
+
+    cutoffs = {}
+    for chunk in chunked(candidates):
+        cutoffs.update(
+            (product_id, (count, lowest))
+            for product_id, count, lowest in RelatedProduct.objects.filter(product_id__in=chunk)
+            .values('product_id')
+            .annotate(count=Count('pk'), lowest=Min('score'))
+            .values_list('product_id', 'count', 'lowest')
+        )
+    for product_id, score in candidates.items():
+        count, lowest = cutoffs.get(product_id, (0, 0.0))
+        if count < TOP_N or score > lowest:
+            affected.add(product_id)
+    return affected
+
+
+def mark_stale(product_ids):
+    """
+    Queue products for the next incremental update.
+    """
+    from .models import RelatedProductQueue
+
+    enqueue(RelatedProductQueue, product_ids)
+
+
+def update_stale(batch_size=BATCH_SIZE):
+    """
+    Drain the queue: recompute the queued products and everyone whose list
+    they affect, or everything when most of the catalog changed. Products
+    queued while this runs stay queued for next time.
+    """
+    from .models import RelatedProductQueue
+
+    with claim(RelatedProductQueue) as changed_ids:
+        if not changed_ids:
+            return 0
+        features = Features.load()
+        if len(changed_ids) > FULL_REBUILD_SHARE * len(features.product_ids):
+            return _recompute_all(features, batch_size)
+        return compute(features, affected_products(features, changed_ids, batch_size), batch_size)
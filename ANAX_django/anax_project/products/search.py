@@ -0,0 +1,144 @@
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Case, FloatField, IntegerField, When
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+from core.batch import chunked
+from . import fuzzy
+
+FTS_TABLE = 'products_product_fts'
+
+# Column weights for bm25(): name, description, sku, tags, category.
+RANK_WEIGHTS = (10.0, 1.0, 5.0, 3.0, 2.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+def _document_rows(product_ids):
+    from .models import Product
+
+    tags = {}
+    through = Product.tags.through
+    for product_id, tag_name in through.objects.filter(
+        product_id__in=product_ids
+    ).values_list('product_id', 'tag__name'):
+        tags.setdefault(product_id, []).append(tag_name)
+
+    rows = Product.objects.filter(pk__in=product_ids).values_list(
+        'id', 'name', 'description', 'sku', 'category__name',
+    )
+    return [
+        (pk, name, description, sku, ' '.join(tags.get(pk, ())), category or '')
+        for pk, name, description, sku, category in rows
+    ]
+
+
+def index_products(product_ids):
+    """
+    (Re)build the full-text documents for the given products. Products that no
+    longer exist are simply dropped from the index.
+    """
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in chunked(set(product_ids)):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+            rows = _document_rows(chunk)
+            if rows:
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, name, description, sku, tags, category) "
+                    "VALUES (%s, %s, %s, %s, %s, %s)",
+                    rows,
+                )
+
+
+def remove_products(product_ids):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        for chunk in chunked(set(product_ids)):
+            placeholders = ', '.join(['%s'] * len(chunk))
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})", chunk)
+
+
+def rebuild_index():
+    from .models import Product
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    index_products(Product.objects.values_list('pk', flat=True))
+
+
+def build_match_query(terms):
+    """
+    Turn free text into a safe FTS5 MATCH expression: every token is quoted so
+    user input can't inject FTS syntax, and the last one is a prefix match so
+    results show up while the user is still typing.
+    """
+    tokens = TOKEN_RE.findall(terms.lower())
+    if not tokens:
+        return None
+    quoted = [f'"{token}"' for token in tokens]
+    quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def search_queryset(queryset, terms):
+    """
+    `queryset` narrowed to the products matching `terms`, best match first.
+    The FTS index is joined on rowid in the same statement as the other
+    filters, so nothing that passes them is cut off by better matches
+    elsewhere in the catalog. The bm25 score is annotated as `search_rank`
+    for keyset pagination to seek on.
+    """
+    match = build_match_query(terms)
+    if match is None:
+        return queryset.none()
+    fts = connection.ops.quote_name(FTS_TABLE)
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return (
+        queryset.filter(search_document__isnull=False)
+        .filter(RawSQL(f"{fts} MATCH %s", [match], output_field=BooleanField()))
+        .annotate(search_rank=RawSQL(f"bm25({fts}, {weights})", [], output_field=FloatField()))
+        .order_by('search_rank')
+    )
+
+
+def order_by_ids(queryset, ids):
+    """
+    Restrict `queryset` to `ids`, ordered by their position in the list. The
+    position is exposed as `search_rank` so keyset pagination can seek on it.
+    """
+    if not ids:
+        return queryset.none()
+    ranking = Case(
+        *[When(pk=pk, then=position) for position, pk in enumerate(ids)],
+        output_field=IntegerField(),
+    )
+    return queryset.filter(pk__in=ids).annotate(search_rank=ranking).order_by('search_rank')
+
+
+class ProductSearchFilter(filters.SearchFilter):
+    """
+    `?search=` backed by the SQLite FTS5 index and ranked by relevance. Falls
+    back to DRF's icontains search on other database backends.
+
+    `?fuzzy=1` switches to the typo-tolerant trigram search over name and SKU
+    instead (see products.fuzzy).
+    """
+    fuzzy_param = 'fuzzy'
+
+    def filter_queryset(self, request, queryset, view):
+        terms = request.query_params.get(self.search_param, '').strip()
+        if terms and request.query_params.get(self.fuzzy_param) in ('1', 'true'):
+            return order_by_ids(queryset, fuzzy.search_product_ids(terms, queryset))
+        if not terms or not fts_available():
+            return super().filter_queryset(request, queryset, view)
+        return search_queryset(queryset, terms)
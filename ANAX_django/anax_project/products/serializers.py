@@ -1,18 +1,53 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.db import transaction
 from rest_framework import serializers
+from core.fieldsets import ExpandableFieldsMixin, SparseFieldsetMixin
+from . import derivatives, lookup
 from .models import Product, ProductImage, Category
 
+# Files of one upload written to storage in parallel.
+STORAGE_WRITE_WORKERS = 4
+
 class ProductImageSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'variants']
 
-class ProductSerializer(serializers.ModelSerializer):
-    images = ProductImageSerializer(many=True, read_only=True)
+    def get_variants(self, obj):
+        # Empty until the derivative pipeline has processed this upload.
+        if obj.derivatives.get('source') != obj.image.name:
+            return {}
+        storage = obj.image.storage
+        request = self.context.get('request')
+        variants = {}
+        for name, path in obj.derivatives.items():
+            if name == 'source':
+                continue
+            url = storage.url(path)
+            variants[name] = request.build_absolute_uri(url) if request else url
+        return variants
+
+class ProductSerializer(SparseFieldsetMixin, ExpandableFieldsMixin, serializers.ModelSerializer):
+    images = serializers.PrimaryKeyRelatedField(many=True, read_only=True)  # ?expand=images for details
     category = serializers.StringRelatedField()  # Shows category name
   
     class Meta:
         model = Product
         fields = '__all__'
+        expandable_fields = {'images': (ProductImageSerializer, {'many': True})}
+
+
+class ProductSummarySerializer(serializers.ModelSerializer):
+    """
+    What carts and orders show for a product unless it is expanded.
+    """
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'sku', 'price']
         
 
 class ProductCreateSerializer(serializers.ModelSerializer):
@@ -26,7 +61,66 @@ class ProductCreateSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         images = validated_data.pop('images')
-        product = Product.objects.create(**validated_data)
-        for image in images:
-            ProductImage.objects.create(product=product, image=image)
-        return product
\ No newline at end of file
+        with transaction.atomic():
+            product = Product.objects.create(**validated_data)
+            save_product_images(product, images)
+        return product
+
+
+def save_product_images(product, uploads):
+    """
+    Write the uploaded files to storage concurrently, then insert all their
+    ProductImage rows with one bulk insert. Uploads Django spooled to disk are
+    moved into place by FileSystemStorage rather than copied.
+    """
+    if not uploads:
+        return []
+    field = ProductImage._meta.get_field('image')
+
+    def write(upload):
+        name = field.generate_filename(None, upload.name)
+        return field.storage.save(name, upload, max_length=field.max_length)
+
+    with ThreadPoolExecutor(max_workers=min(len(uploads), STORAGE_WRITE_WORKERS)) as pool:
+        futures = [pool.submit(write, upload) for upload in uploads]
+    saved = [(future.result(), upload) for future, upload in zip(futures, uploads) if future.exception() is None]
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    try:
+        if errors:
+            raise errors[0]
+        with transaction.atomic():
+            for name, upload in saved:
+                derivatives.retain(name, upload, field.storage)
+            images = ProductImage.objects.bulk_create(
+                [ProductImage(product=product, image=name) for name, _ in saved]
+            )
+    except Exception:
+        # Identical content may already belong to another image.
+        derivatives.discard([name for name, _ in saved], field.storage)
+        raise
+
+    # bulk_create skips post_save, so queue the derivative renders directly.
+    for image in images:
+        transaction.on_commit(partial(derivatives.schedule, image.pk))
+    return images
+
+
+class ProductBulkUpdateItemSerializer(serializers.Serializer):
+    id = serializers.IntegerField(required=False)
+    sku = serializers.CharField(max_length=50, required=False)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0, required=False)
+    label = serializers.ChoiceField(choices=Product._meta.get_field('label').choices, allow_blank=True, required=False)
+    is_active = serializers.BooleanField(required=False)
+
+    def validate(self, attrs):
+        if 'id' not in attrs and 'sku' not in attrs:
+            raise serializers.ValidationError("Either id or sku is required.")
+        if not {'price', 'label', 'is_active'} & attrs.keys():
+            raise serializers.ValidationError("Nothing to update: give price, label or is_active.")
+        return attrs
+
+
+class ProductLookupSerializer(serializers.Serializer):
+    skus = serializers.ListField(
+        child=serializers.CharField(max_length=50), allow_empty=False, max_length=lookup.MAX_SKUS,
+    )
@@ -0,0 +1,211 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import Signal, receiver
+
+from . import autocomplete, cache, category_tree, derivatives, detail_cache, fuzzy, related, search
+from .models import (
+    Category, Inventory, Product, ProductImage, ProductStats, ProductTombstone, ProductVariant, RelatedProduct, Tag,
+)
+
+# Sent after set-based writes (bulk_create/bulk_update/queryset.update) that
+# bypass the per-instance signals below, with `product_ids` of every product
+# touched and optionally the `fields` written (None meaning any), so the
+# derived indexes and caches can catch up.
+products_bulk_changed = Signal()
+
+SEARCH_FIELDS = {'name', 'description', 'sku', 'category', 'tags'}
+RELATED_FIELDS = {'category', 'tags', 'is_active'}
+
+
+def related_rows_changed(product_ids):
+    """
+    Something shown with these products changed without saving them: bump
+    updated_at for conditional requests and retire their cached details.
+    """
+    if not product_ids:
+        return
+    Product.objects.filter(pk__in=product_ids).touch()
+    transaction.on_commit(lambda: detail_cache.invalidate(product_ids))
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    search.index_products([instance.pk])
+    fuzzy.index_products([instance])
+    transaction.on_commit(lambda: autocomplete.update_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    search.remove_products([instance.pk])
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.remove_product(pk))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def reindex_product_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # tag.product_set.clear(): remember who loses the tag before it's gone.
+        instance._affected_product_ids = list(instance.product_set.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = getattr(instance, '_affected_product_ids', [])
+    else:
+        product_ids = list(pk_set or [])
+    search.index_products(product_ids)
+    related.mark_stale(product_ids)
+    related_rows_changed(product_ids)
+
+
+@receiver(post_save, sender=Tag)
+def reindex_tag_products(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    search.index_products(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    if raw or created:
+        return
+    product_ids = list(instance.product_set.values_list('pk', flat=True))
+    search.index_products(product_ids)
+    # Product payloads show the category's name.
+    related_rows_changed(product_ids)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Category)
+def remember_affected_products(sender, instance, **kwargs):
+    instance._affected_product_ids = list(instance.product_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Category)
+def reindex_affected_products(sender, instance, **kwargs):
+    product_ids = getattr(instance, '_affected_product_ids', [])
+    search.index_products(product_ids)
+    related.mark_stale(product_ids)
+    related_rows_changed(product_ids)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_catalog_version(sender, **kwargs):
+    # Anything cached per filter set (facet counts) is keyed on this version.
+    transaction.on_commit(lambda: cache.bump_version('catalog'))
+
+
+@receiver(post_delete, sender=Category)
+def reroot_orphaned_subcategories(sender, instance, **kwargs):
+    # Children were detached with a bulk SET NULL, so re-root their subtrees.
+    if instance.path:
+        Category.rewrite_subtree(instance.path, '/', -(instance.depth + 1))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    transaction.on_commit(category_tree.invalidate)
+
+
+@receiver(products_bulk_changed)
+def reindex_bulk_changed_products(sender, product_ids, fields=None, **kwargs):
+    fields = SEARCH_FIELDS | {'is_active'} if fields is None else set(fields)
+    if fields & SEARCH_FIELDS:
+        search.index_products(product_ids)
+    if fields & {'name', 'sku'}:
+        fuzzy.index_products(Product.objects.filter(pk__in=product_ids).only('pk', 'name', 'sku'))
+    if fields & {'name', 'sku', 'is_active'}:
+        transaction.on_commit(autocomplete.invalidate)
+    if fields & RELATED_FIELDS:
+        related.mark_stale(product_ids)
+    transaction.on_commit(lambda: cache.bump_version('catalog'))
+    transaction.on_commit(lambda: detail_cache.invalidate(product_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: detail_cache.invalidate([pk]))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+@receiver(post_save, sender=Inventory)
+@receiver(post_delete, sender=Inventory)
+def parent_product_changed(sender, instance, **kwargs):
+    related_rows_changed([instance.product_id])
+
+
+@receiver(post_save, sender=ProductImage)
+def schedule_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or derivatives.is_current(instance):
+        return
+    pk = instance.pk
+    transaction.on_commit(lambda: derivatives.schedule(pk))
+
+
+@receiver(post_delete, sender=ProductImage)
+def release_image_files(sender, instance, **kwargs):
+    storage = instance.image.storage
+    files = dict(instance.derivatives)
+    if files.get('source') != instance.image.name:
+        # No current variants; the original still needs letting go of.
+        transaction.on_commit(partial(derivatives.release, {'source': instance.image.name}, storage))
+    transaction.on_commit(partial(derivatives.release, files, storage))
+
+
+@receiver(post_save, sender=Product)
+def queue_related_products(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or (update_fields is not None and not RELATED_FIELDS & set(update_fields)):
+        return
+    related.mark_stale([instance.pk])
+
+
+@receiver(pre_delete, sender=Product)
+def queue_products_listing_deleted(sender, instance, **kwargs):
+    # Their rows pointing here are about to cascade away, leaving a gap.
+    related.mark_stale(RelatedProduct.objects.filter(related=instance).values_list('product_id', flat=True))
+
+
+@receiver(post_delete, sender=Product)
+def record_product_tombstone(sender, instance, **kwargs):
+    # Offline replicas learn about deletes from these, see products.changes.
+    ProductTombstone.objects.create(product_id=instance.pk, sku=instance.sku)
+
+
+def ensure_stats_rows(product_ids):
+    # Sorting by popularity inner-joins ProductStats, so every product needs a row.
+    ProductStats.objects.bulk_create(
+        [ProductStats(product_id=pk) for pk in product_ids], ignore_conflicts=True, batch_size=500,
+    )
+
+
+@receiver(post_save, sender=Product)
+def create_product_stats(sender, instance, created, **kwargs):
+    if created:
+        ensure_stats_rows([instance.pk])
+
+
+@receiver(products_bulk_changed)
+def create_bulk_product_stats(sender, product_ids, fields=None, **kwargs):
+    # Only bulk writes that may have created products (imports) send no fields.
+    if fields is None:
+        ensure_stats_rows(product_ids)
@@ -0,0 +1,57 @@
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def content_digest(content):
+    """
+    sha256 of a Django File, read in chunks and rewound afterwards.
+    """
+    hasher = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        hasher.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return hasher.hexdigest()
+
+
+def addressed_name(name, digest):
+    """
+    products/photo.JPG -> products/ab/ab12...ef.jpg
+    """
+    directory, filename = posixpath.split(name)
+    ext = posixpath.splitext(filename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + ext)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every file under the sha256 of its content, so each distinct blob
+    is kept once no matter how many times it is uploaded. Saving content that
+    is already stored skips the write and returns the existing name.
+
+    Several rows may point at the same file, so each row using one is counted
+    with products.derivatives.retain(), and callers must go through
+    products.derivatives.release() rather than delete() when letting one go.
+    """
+
+    def _save(self, name, content):
+        return self.save_derived(addressed_name(name, content_digest(content)), content)
+
+    def save_derived(self, name, content):
+        """
+        Save under a name that is already unique to its content, e.g. a
+        variant named after its original's digest. Existing files are kept.
+        """
+        if self.exists(name):
+            return name
+        return super()._save(name, content)
+
+
+def product_image_storage():
+    return ContentAddressedStorage()
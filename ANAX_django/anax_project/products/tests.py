@@ -1,3 +1,1181 @@
-from django.test import TestCase
+import csv
+import json
+import sys
+import threading
+import time
+from base64 import b64encode
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from core.models import AuditLog
+from core.testing import QueryBudgetTestCase, TemporaryMediaMixin
+from . import autocomplete, changes, derivatives, lookup, popularity, related
+from . import cache as product_cache
+from .filters import ProductFilter
+from .importers import import_products
+from .models import (
+    Category, Inventory, Product, ProductImage, ProductStats, RelatedProduct, RelatedProductQueue, StoredImage, Tag,
+)
+from .serializers import ProductImageSerializer
+from .storage import ContentAddressedStorage
+from .views import (
+    ProductChangesAPIView, ProductDetailAPIView, ProductFacetsAPIView, ProductListAPIView, ProductLookupAPIView,
+    RelatedProductsAPIView,
+)
+
+
+class ProductQueryBudgetTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='shopper', password='x')
+        category = Category.objects.create(name='Phones', slug='phones')
+        tags = [Tag.objects.create(name=name) for name in ('android', 'ios', '5g')]
+        for i in range(25):
+            product = Product.objects.create(
+                name=f'Phone {i}', description='A phone', price=Decimal('100.00'),
+                category=category, condition='new', sku=f'PH-{i:03}',
+            )
+            product.tags.set(tags)
+            ProductImage.objects.create(
+                product=product, image=SimpleUploadedFile(f'p{i}.jpg', b'img'),
+            )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_stays_within_budget(self):
+        response = self.assertWithinQueryBudget(ProductListAPIView, reverse('product-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 25)
+
+    def test_detail_stays_within_budget(self):
+        product = Product.objects.first()
+        url = reverse('product-detail', kwargs={'id': product.id})
+        response = self.assertWithinQueryBudget(ProductDetailAPIView, url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['tags']), 3)
+
+
+
+class ProductDetailCacheTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='browser', password='x')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Audio', slug='audio')
+        self.product = Product.objects.create(
+            name='Speaker', description='', price=Decimal('80.00'), category=self.category,
+            condition='new', sku='SPK-1',
+        )
+        self.url = reverse('product-detail', kwargs={'id': self.product.id})
+
+    def get(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get(self.url)
+
+    def test_warm_hit_only_looks_up_validators(self):
+        self.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['price'], '80.00')
+
+    def test_product_and_related_changes_invalidate(self):
+        self.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('75.00')
+            self.product.save()
+        self.assertEqual(self.get().data['price'], '75.00')
+
+        # The upload is not a real image, so skip rendering its variants.
+        with mock.patch.object(derivatives, 'schedule'), self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image=SimpleUploadedFile('s.jpg', b'img'))
+        self.assertEqual(len(self.get().data['images']), 1)
+
+        # Products lose a deleted category through a bulk SET NULL.
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.delete()
+        self.assertIsNone(self.get().data['category'])
+
+    def test_missing_product_is_not_cached(self):
+        url = reverse('product-detail', kwargs={'id': self.product.id + 1})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        Product.objects.create(name='Sub', description='', price=Decimal('1.00'), condition='new', sku='SUB-1')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_concurrent_misses_build_once(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'ok': True}
+
+        threads = [
+            threading.Thread(target=product_cache.get_or_build, args=('products:test:flight', build))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+
+
+
+class ConditionalRequestTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='commuter', password='x')
+        self.client.force_authenticate(self.user)
+        self.product = Product.objects.create(
+            name='Router', description='', price=Decimal('60.00'), condition='new', sku='RT-1',
+        )
+        Product.objects.create(name='Modem', description='', price=Decimal('40.00'), condition='new', sku='MD-1')
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(
+            url, params,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+        )
+
+    def test_list_revalidates_without_serializing(self):
+        url = reverse('product-list')
+        first = self.client.get(url, {'page_size': 1})
+        with self.assertNumQueries(0):
+            again = self.revalidate(url, first, page_size=1)
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again['ETag'], first['ETag'])
+
+        # Different parameters are a different representation.
+        self.assertEqual(self.revalidate(url, first, page_size=2).status_code, 200)
+
+    def test_list_etag_changes_with_edits_related_rows_and_deletes(self):
+        url = reverse('product-list')
+        etags = [self.client.get(url)['ETag']]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.tags.add(Tag.objects.create(name='wifi'))
+        etags.append(self.client.get(url)['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Inventory.objects.create(product=self.product, quantity=3)
+        etags.append(self.client.get(url)['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(sku='MD-1').delete()
+        etags.append(self.client.get(url)['ETag'])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_detail_not_modified_since(self):
+        url = reverse('product-detail', kwargs={'id': self.product.id})
+        first = self.client.get(url)
+        again = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.price = Decimal('55.00')
+            self.product.save()
+        changed = self.revalidate(url, first)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['price'], '55.00')
+
+    def test_detail_modified_by_category_rename(self):
+        category = Category.objects.create(name='Network', slug='network')
+        Product.objects.filter(pk=self.product.pk).update(
+            category=category, updated_at=timezone.now() - timedelta(hours=1),
+        )
+        url = reverse('product-detail', kwargs={'id': self.product.id})
+        first = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            category.name = 'Networking'
+            category.save()
+        changed = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.data['category'], 'Networking')
+
+
+
+class SparseFieldsetTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='grid', password='x')
+        category = Category.objects.create(name='Toys', slug='toys')
+        for i in range(3):
+            product = Product.objects.create(
+                name=f'Kite {i}', description='x' * 4000, price=Decimal('9.00'),
+                category=category, condition='new', sku=f'KT-{i}',
+            )
+            product.tags.add(Tag.objects.create(name=f'tag{i}'))
+            ProductImage.objects.create(product=product, image=SimpleUploadedFile(f'k{i}.jpg', b'img'))
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_list_trims_output_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('product-list'), {'fields': 'id,name,price,images'})
+        self.assertEqual(set(response.data['results'][0]), {'id', 'name', 'price', 'images'})
+        self.assertTrue(response.data['results'][0]['images'])
+        sql = [query['sql'] for query in ctx.captured_queries]
+        page = next(q for q in sql if 'LIMIT' in q)
+        self.assertNotIn('"description"', page)
+        self.assertNotIn('products_category', page)
+        # Page and images; the tags prefetch is dropped.
+        self.assertEqual(len(sql), 2)
+
+    def test_detail_trims_output(self):
+        product = Product.objects.get(sku='KT-1')
+        url = reverse('product-detail', kwargs={'id': product.id})
+        data = self.client.get(url, {'fields': 'id,category'}).data
+        self.assertEqual(data, {'id': product.id, 'category': str(product.category)})
+        self.assertIn('description', self.client.get(url).data)
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse('product-list'), {'fields': 'id,colour'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+
+    def test_writes_keep_every_field(self):
+        product = Product.objects.get(sku='KT-1')
+        self.user.is_staff = True
+        self.user.save()
+        url = reverse('product-update', kwargs={'id': product.id}) + '?fields=id'
+        response = self.client.patch(url, {'price': '12.50'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['price'], '12.50')
+        product.refresh_from_db()
+        self.assertEqual(product.price, Decimal('12.50'))
+
+
+class ProductPaginationTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='pager', password='x')
+        created_at = timezone.now()
+        for i in range(7):
+            product = Product.objects.create(
+                name=f'Cable {i}', description='', price=Decimal(10 + i % 3),
+                condition='new', sku=f'CB-{i}',
+            )
+            # Several rows share a timestamp so the id tie-breaker matters.
+            Product.objects.filter(pk=product.pk).update(created_at=created_at)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def walk(self, params):
+        ids, url, pages = [], reverse('product-list'), 0
+        response = self.client.get(url, params)
+        while True:
+            pages += 1
+            ids += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                return ids, pages
+            response = self.client.get(response.data['next'])
+
+    def test_walks_every_row_once_in_order(self):
+        ids, pages = self.walk({'page_size': 3})
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 3)
+
+    def test_honours_ordering_param(self):
+        ids, _ = self.walk({'page_size': 2, 'ordering': 'price'})
+        expected = list(Product.objects.order_by('price', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_previous_link_returns_the_prior_page(self):
+        first = self.client.get(reverse('product-list'), {'page_size': 3})
+        second = self.client.get(first.data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual(back.data['results'], first.data['results'])
+        self.assertIsNone(back.data['previous'])
+
+    def test_malformed_cursors_are_not_found(self):
+        url = reverse('product-list')
+        cases = [
+            ({}, ['abc', 1]), ({}, ['2020-01-01', 'zz']), ({}, [[1], 1]), ({}, [None, 1]),
+            ({}, [1]), ({'ordering': 'price'}, ['cheap', 1]),
+        ]
+        for params, position in cases:
+            cursor = b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get(url, {**params, 'cursor': cursor})
+            self.assertEqual(response.status_code, 404, position)
+
+    def test_count_only_when_requested(self):
+        url = reverse('product-list')
+        # Page, images and tags; no COUNT(*).
+        with self.assertNumQueries(3):
+            response = self.client.get(url, {'page_size': 3})
+        self.assertNotIn('count', response.data)
+        self.assertEqual(self.client.get(url, {'count': 1}).data['count'], 7)
+
+
+class ProductSearchTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='clerk', password='x')
+        cls.phones = Category.objects.create(name='Phones', slug='phones')
+        cls.galaxy = Product.objects.create(
+            name='Samsung Galaxy S23', description='Flagship phone', price=Decimal('900.00'),
+            category=cls.phones, condition='new', sku='SAM-S23',
+        )
+        cls.case = Product.objects.create(
+            name='Leather case', description='Fits the Samsung Galaxy range', price=Decimal('20.00'),
+            condition='new', sku='CASE-01',
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def search(self, term):
+        response = self.client.get(reverse('product-list'), {'search': term})
+        return [item['id'] for item in response.data['results']]
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.search('galaxy'), [self.galaxy.id, self.case.id])
+
+    def test_prefix_and_sku_matches(self):
+        self.assertEqual(self.search('sam-s2'), [self.galaxy.id])
+
+    def test_index_follows_tag_and_category_changes(self):
+        tag = Tag.objects.create(name='waterproof')
+        self.case.tags.add(tag)
+        self.assertEqual(self.search('waterproof'), [self.case.id])
+        tag.name = 'rugged'
+        tag.save()
+        self.assertEqual(self.search('waterproof'), [])
+        self.phones.name = 'Smartphones'
+        self.phones.save()
+        self.assertEqual(self.search('smartphones'), [self.galaxy.id])
+
+    def test_fts_syntax_in_input_is_ignored(self):
+        self.assertEqual(self.search('galaxy" OR NEAR('), [])
+
+    def test_filters_apply_before_ranking_and_pages_follow_it(self):
+        for n in range(3):
+            Product.objects.create(
+                name=f'Galaxy Tab {n}', description='', price=Decimal('300.00'), condition='new', sku=f'TAB-{n}',
+            )
+        url = reverse('product-list')
+        response = self.client.get(url, {'search': 'galaxy', 'category': self.phones.pk})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.galaxy.id])
+
+        response = self.client.get(url, {'search': 'galaxy', 'page_size': 2})
+        ids = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(ids, self.search('galaxy'))
+        self.assertEqual(len(ids), 5)
+
+    def test_fuzzy_search_tolerates_typos(self):
+        iphone = Product.objects.create(
+            name='iPhone 15', description='Apple phone', price=Decimal('999.00'),
+            condition='new', sku='APL-IP15',
+        )
+        self.assertEqual(self.search('samsng'), [])
+        response = self.client.get(reverse('product-list'), {'search': 'samsng', 'fuzzy': '1'})
+        self.assertEqual([item['id'] for item in response.data['results']], [self.galaxy.id])
+        response = self.client.get(reverse('product-list'), {'search': 'iphon', 'fuzzy': '1'})
+        self.assertEqual([item['id'] for item in response.data['results']], [iphone.id])
+
+    def test_fuzzy_candidates_come_from_the_filtered_products(self):
+        tab = Product.objects.create(
+            name='Samsung Galaxy Tab', description='', price=Decimal('300.00'), condition='new', sku='SAM-TAB',
+        )
+        params = {'search': 'samsung galaxy tab', 'fuzzy': '1'}
+        with mock.patch('products.fuzzy.CANDIDATES', 1):
+            response = self.client.get(reverse('product-list'), params)
+            self.assertEqual([item['id'] for item in response.data['results']], [tab.id])
+            response = self.client.get(reverse('product-list'), {**params, 'category': self.phones.pk})
+            self.assertEqual([item['id'] for item in response.data['results']], [self.galaxy.id])
+
+
+class ProductAutocompleteTests(QueryBudgetTestCase):
+    def setUp(self):
+        autocomplete.invalidate()
+        self.galaxy = Product.objects.create(
+            name='Samsung Galaxy S23', description='', price=Decimal('900.00'),
+            condition='new', sku='SAM-S23',
+        )
+
+    def complete(self, q):
+        response = self.client.get(reverse('product-autocomplete'), {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data]
+
+    def test_matches_word_starts_and_sku_without_queries(self):
+        self.complete('gal')  # builds the index
+        with self.assertNumQueries(0):
+            self.assertEqual(self.complete('gal'), [self.galaxy.id])
+            self.assertEqual(self.complete('sam s2'), [self.galaxy.id])
+            self.assertEqual(self.complete('laxy'), [])
+
+    def test_follows_saves_and_deletes(self):
+        self.assertEqual(self.complete('note'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            note = Product.objects.create(
+                name='Galaxy Note', description='', price=Decimal('500.00'),
+                condition='used', sku='SAM-NOTE',
+            )
+        self.assertEqual(self.complete('note'), [note.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.galaxy.is_active = False
+            self.galaxy.save()
+        self.assertEqual(self.complete('galaxy'), [note.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            note.delete()
+        self.assertEqual(self.complete('galaxy'), [])
+
+
+    def test_lookups_racing_updates_see_whole_entries(self):
+        index = autocomplete.PrefixIndex()
+        index.bulk_load((pk, f'Cable {pk}', f'CB-{pk}') for pk in range(100))
+        churned = threading.Event()
+
+        def churn():
+            for _ in range(200):
+                for pk in range(100):
+                    index.remove(pk)
+                    index.add(pk, f'Cable {pk}', f'CB-{pk}')
+            churned.set()
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        writer = threading.Thread(target=churn)
+        try:
+            writer.start()
+            while not churned.is_set():
+                for label in index.lookup('cable', 100):
+                    self.assertTrue(label['name'].startswith('Cable'))
+        finally:
+            writer.join()
+            sys.setswitchinterval(interval)
+
+
+class ProductFacetTests(QueryBudgetTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='browser', password='x')
+        cls.phones = Category.objects.create(name='Phones', slug='phones')
+        cls.laptops = Category.objects.create(name='Laptops', slug='laptops')
+        cls.tag = Tag.objects.create(name='5g')
+        for i, (category, price, condition) in enumerate([
+            (cls.phones, '40.00', 'new'), (cls.phones, '700.00', 'used'), (cls.laptops, '1500.00', 'new'),
+        ]):
+            product = Product.objects.create(
+                name=f'Device {i}', description='', price=Decimal(price),
+                category=category, condition=condition, sku=f'DV-{i}', label='sale' if i else '',
+            )
+            if category == cls.phones:
+                product.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def test_counts_every_facet_in_one_query(self):
+        response = self.assertWithinQueryBudget(ProductFacetsAPIView, reverse('product-facets'))
+        self.assertEqual(response.data['category'], [
+            {'value': self.phones.id, 'count': 2}, {'value': self.laptops.id, 'count': 1},
+        ])
+        self.assertEqual(response.data['condition'], [
+            {'value': 'new', 'count': 2}, {'value': 'used', 'count': 1},
+        ])
+        self.assertEqual(response.data['label'], [{'value': 'sale', 'count': 2}])
+        self.assertEqual(response.data['tag'], [{'value': self.tag.id, 'count': 2}])
+        self.assertEqual(
+            sorted((item['value'], item['count']) for item in response.data['price']),
+            [('0-50', 1), ('1000+', 1), ('500-1000', 1)],
+        )
+
+    def test_respects_list_filters_and_search(self):
+        response = self.client.get(reverse('product-facets'), {'category': self.laptops.id})
+        self.assertEqual(response.data['condition'], [{'value': 'new', 'count': 1}])
+        response = self.client.get(reverse('product-facets'), {'search': 'device'})
+        self.assertEqual(sum(item['count'] for item in response.data['condition']), 3)
+
+    def test_cached_until_the_catalog_changes(self):
+        url = reverse('product-facets')
+        self.client.get(url, {'is_active': 'true'})
+        with self.assertNumQueries(0):
+            self.client.get(url, {'is_active': 'true', 'cursor': 'ignored'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                name='Device 3', description='', price=Decimal('60.00'),
+                category=self.laptops, condition='used', sku='DV-3',
+            )
+        response = self.client.get(url, {'is_active': 'true'})
+        self.assertEqual(sum(item['count'] for item in response.data['condition']), 4)
+
+
+class CategoryTreeTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(username='walker', password='x')
+        )
+        # electronics > phones > android > budget > dual-sim > 4g > refurb
+        self.chain = []
+        parent = None
+        for slug in ('electronics', 'phones', 'android', 'budget', 'dual-sim', '4g', 'refurb'):
+            parent = Category.objects.create(name=slug, slug=slug, parent=parent)
+            self.chain.append(parent)
+        self.other = Category.objects.create(name='Furniture', slug='furniture')
+        self.deep = self.make_product(self.chain[-1], 'DEEP')
+        self.mid = self.make_product(self.chain[2], 'MID')
+        self.sofa = self.make_product(self.other, 'SOFA')
+
+    def make_product(self, category, sku):
+        return Product.objects.create(
+            name=sku, description='', price=Decimal('1.00'), category=category,
+            condition='new', sku=sku,
+        )
+
+    def subtree(self, slug):
+        response = self.client.get(reverse('product-list'), {'category_tree': slug})
+        return {item['id'] for item in response.data['results']}
+
+    def test_paths_follow_the_hierarchy(self):
+        leaf = self.chain[-1]
+        self.assertEqual(leaf.depth, 6)
+        self.assertEqual(leaf.path, ''.join(f'/{c.pk}' for c in self.chain) + '/')
+
+    def test_filters_whole_subtree_in_one_query(self):
+        filtered = ProductFilter({'category_tree': 'phones'}, queryset=Product.objects.all()).qs
+        with self.assertNumQueries(1):
+            self.assertEqual({p.pk for p in filtered}, {self.deep.pk, self.mid.pk})
+        self.assertEqual(self.subtree('budget'), {self.deep.pk})
+        self.assertEqual(self.subtree('furniture'), {self.sofa.pk})
+        self.assertEqual(self.subtree('missing'), set())
+
+    def test_moving_a_category_moves_its_subtree(self):
+        budget = self.chain[3]
+        budget.parent = self.other
+        budget.save()
+        self.assertEqual(self.subtree('furniture'), {self.deep.pk, self.sofa.pk})
+        self.assertEqual(self.subtree('phones'), {self.mid.pk})
+        leaf = Category.objects.get(pk=self.chain[-1].pk)
+        self.assertEqual(leaf.depth, 4)
+        self.assertTrue(leaf.path.startswith(f'/{self.other.pk}/{budget.pk}/'))
+
+    def test_cannot_move_under_own_descendant(self):
+        root = self.chain[0]
+        root.parent = self.chain[3]
+        with self.assertRaises(ValueError):
+            root.save()
+
+    def test_deleting_a_category_re_roots_its_children(self):
+        self.chain[1].delete()
+        android = Category.objects.get(slug='android')
+        self.assertEqual((android.path, android.depth), (f'/{android.pk}/', 0))
+        self.assertEqual(self.subtree('android'), {self.deep.pk, self.mid.pk})
+
+
+class CategoryTreeEndpointTests(QueryBudgetTestCase):
+    def setUp(self):
+        cache.clear()
+        self.electronics = Category.objects.create(name='Electronics', slug='electronics')
+        self.phones = Category.objects.create(name='Phones', slug='phones', parent=self.electronics)
+
+    def test_nested_tree_with_etag_revalidation(self):
+        url = reverse('category-tree')
+        response = self.client.get(url)
+        self.assertEqual(response.json(), [{
+            'id': self.electronics.id, 'name': 'Electronics', 'slug': 'electronics',
+            'children': [{'id': self.phones.id, 'name': 'Phones', 'slug': 'phones', 'children': []}],
+        }])
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(name='Laptops', slug='laptops', parent=self.electronics)
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+        self.assertEqual(len(changed.json()[0]['children']), 2)
+
+
+class ProductImportTests(QueryBudgetTestCase):
+    CSV = (
+        "sku,name,description,price,condition,label,category,tags,quantity,variants\n"
+        "IMP-1,Tecno Spark,Budget phone,150.00,new,sale,phones,android|budget,12,\n"
+        "IMP-2,Infinix Hot,,180,used,,phones,android,3,"
+        "\"[{\"\"color\"\": \"\"blue\"\", \"\"size\"\": \"\"M\"\"}]\"\n"
+        "IMP-3,Broken row,,-1,new,,phones,,,\n"
+        "IMP-4,Nowhere,,10,new,,no-such-category,,,\n"
+    )
+
+    def setUp(self):
+        self.phones = Category.objects.create(name='Phones', slug='phones')
+        Product.objects.create(
+            name='Old Tecno', description='', price=Decimal('99.00'), condition='used',
+            sku='IMP-1', category=self.phones,
+        )
+
+    def run_import(self, data, fmt, **kwargs):
+        return import_products(BytesIO(data.encode('utf-8')), fmt, **kwargs)
+
+    def test_csv_upserts_by_sku_and_reports_bad_rows(self):
+        result = self.run_import(self.CSV, 'csv', chunk_size=1)
+        self.assertEqual((result.created, result.updated, result.failed), (1, 1, 2))
+        self.assertEqual([e['line'] for e in result.errors], [4, 5])
+
+        tecno = Product.objects.get(sku='IMP-1')
+        self.assertEqual((tecno.name, tecno.price, tecno.label), ('Tecno Spark', Decimal('150.00'), 'sale'))
+        self.assertEqual(sorted(tecno.tags.values_list('name', flat=True)), ['android', 'budget'])
+        self.assertEqual(tecno.inventory.quantity, 12)
+        infinix = Product.objects.get(sku='IMP-2')
+        self.assertEqual(list(infinix.variants.values_list('color', 'size')), [('blue', 'M')])
+        self.assertEqual(Tag.objects.filter(name='android').count(), 1)
+
+        # Bulk writes still reach the search index.
+        self.client.force_authenticate(get_user_model().objects.create_user(username='s', password='x'))
+        response = self.client.get(reverse('product-list'), {'search': 'spark'})
+        self.assertEqual([item['id'] for item in response.data['results']], [tecno.id])
+
+    def test_jsonl_and_reimport_is_idempotent(self):
+        line = '{"sku": "IMP-9", "name": "Nokia 105", "price": "25", "condition": "new", "tags": ["feature"]}\n'
+        self.assertEqual(self.run_import(line + 'not json\n', 'jsonl').created, 1)
+        result = self.run_import(line, 'jsonl')
+        self.assertEqual((result.created, result.updated), (0, 1))
+        self.assertEqual(Product.objects.get(sku='IMP-9').tags.count(), 1)
+
+    def test_missing_columns_keep_existing_values(self):
+        Product.objects.filter(sku='IMP-1').update(description='Kept', label='sale', is_active=False)
+        self.run_import("sku,name,price,condition\nIMP-1,Tecno Spark,150.00,new\nIMP-5,Itel A70,90,new\n", 'csv')
+        tecno = Product.objects.get(sku='IMP-1')
+        self.assertEqual(
+            (tecno.name, tecno.description, tecno.label, tecno.is_active, tecno.category),
+            ('Tecno Spark', 'Kept', 'sale', False, self.phones),
+        )
+        self.assertTrue(Product.objects.get(sku='IMP-5').is_active)
+
+        self.run_import('{"sku": "IMP-1", "name": "Tecno Spark", "price": "150", "condition": "new", "label": ""}\n', 'jsonl')
+        tecno.refresh_from_db()
+        self.assertEqual((tecno.description, tecno.label, tecno.is_active), ('Kept', '', False))
+
+    def test_upload_endpoint_requires_a_store_manager(self):
+        url = reverse('product-import')
+        upload = SimpleUploadedFile('catalog.csv', self.CSV.encode('utf-8'))
+        user = get_user_model().objects.create_user(username='clerk', password='x')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        upload.seek(0)
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated']), (1, 1))
+
+
+class ProductExportTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    def setUp(self):
+        self.client.force_authenticate(
+            get_user_model().objects.create_user(username='accounts', password='x', is_staff=True)
+        )
+        phones = Category.objects.create(name='Phones', slug='phones')
+        self.phone = Product.objects.create(
+            name='Tecno, "Spark"', description='', price=Decimal('150.00'), condition='new',
+            sku='EXP-1', category=phones,
+        )
+        Inventory.objects.create(product=self.phone, quantity=7)
+        ProductImage.objects.create(product=self.phone, image=SimpleUploadedFile('side.jpg', b'x'))
+        ProductImage.objects.create(product=self.phone, image=SimpleUploadedFile('front.jpg', b'x'), is_primary=True)
+        Product.objects.create(
+            name='Cable', description='', price=Decimal('5.00'), condition='new', sku='EXP-2', is_active=False,
+        )
+
+    def export(self, **params):
+        response = self.client.get(reverse('product-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_ndjson_rows_carry_price_stock_and_primary_image(self):
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['sku'] for row in rows], ['EXP-1', 'EXP-2'])
+        self.assertEqual((rows[0]['price'], rows[0]['quantity'], rows[0]['category']), ('150.00', 7, 'phones'))
+        self.assertRegex(rows[0]['image'], r'^http://testserver/media/products/[0-9a-f]{2}/')
+        self.assertEqual((rows[1]['quantity'], rows[1]['image']), (0, None))
+
+    def test_csv_honours_list_filters(self):
+        rows = list(csv.DictReader(StringIO(self.export(type='csv', is_active='true'))))
+        self.assertEqual([(row['sku'], row['name']) for row in rows], [('EXP-1', 'Tecno, "Spark"')])
+
+    def test_invalid_filters_are_rejected(self):
+        response = self.client.get(reverse('product-export'), {'category': 'abc', 'price__gte': 'zz'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.data), {'category', 'price__gte'})
+
+
+
+class ProductBulkUpdateTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.manager = get_user_model().objects.create_user(username='pricing', password='x', is_staff=True)
+        self.client.force_authenticate(self.manager)
+        self.products = [
+            Product.objects.create(
+                name=f'Item {i}', description='', price=Decimal('10.00'), condition='new', sku=f'BLK-{i}',
+            )
+            for i in range(3)
+        ]
+
+    def patch(self, entries):
+        return self.client.patch(reverse('product-bulk-update'), entries, format='json')
+
+    def test_applies_entries_by_id_or_sku_with_one_audit_entry(self):
+        first, second, third = self.products
+        response = self.patch([
+            {'id': first.id, 'price': '7.50', 'label': 'sale'},
+            {'sku': 'BLK-1', 'is_active': False},
+            {'sku': 'NOPE', 'price': '1.00'},
+            {'id': 999999, 'price': '1.00'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'updated': 2, 'not_found': ['NOPE', 999999]})
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        third.refresh_from_db()
+        self.assertEqual((first.price, first.label, first.is_active), (Decimal('7.50'), 'sale', True))
+        self.assertEqual((second.price, second.is_active), (Decimal('10.00'), False))
+        self.assertGreater(first.updated_at, third.updated_at)
+
+        log = AuditLog.objects.get()
+        self.assertEqual((log.action, log.user), ('product_bulk_update', 'pricing'))
+        self.assertEqual(json.loads(log.description)['product_ids'], [first.id, second.id])
+
+    def test_rejects_invalid_entries_without_writing(self):
+        response = self.patch([{'id': self.products[0].id, 'price': '-1'}, {'price': '5'}])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(AuditLog.objects.exists())
+
+    def test_requires_a_store_manager(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(username='clerk', password='x'))
+        self.assertEqual(self.patch([{'id': self.products[0].id, 'price': '1'}]).status_code, 403)
+
+
+
+class ImageDerivativeTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Lamp', description='', price=Decimal('30.00'), condition='new', sku='LAMP-1',
+        )
+
+    def make_image(self, size=(1200, 800)):
+        buffer = BytesIO()
+        PILImage.new('RGB', size, 'orange').save(buffer, 'JPEG')
+        return ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile('lamp.jpg', buffer.getvalue()),
+        )
+
+    def test_generate_renders_fixed_size_variants(self):
+        image = self.make_image()
+        derivatives.generate(image)
+        storage = image.image.storage
+        with storage.open(image.derivatives['thumb']) as thumb:
+            self.assertEqual(PILImage.open(thumb).size, (200, 200))
+        with storage.open(image.derivatives['zoom']) as zoom:
+            self.assertEqual(PILImage.open(zoom).size, (1200, 800))
+
+        data = ProductImageSerializer(ProductImage.objects.get(pk=image.pk)).data
+        self.assertEqual(set(data['variants']), {'thumb', 'card', 'zoom'})
+        self.assertRegex(data['variants']['card'], r'^/media/products/[0-9a-f]{2}/derivatives/')
+
+    def test_variants_are_hidden_until_current(self):
+        image = self.make_image()
+        self.assertEqual(ProductImageSerializer(image).data['variants'], {})
+
+    def test_create_writes_all_uploads_with_one_insert(self):
+        uploads = []
+        for i, colour in enumerate(('red', 'green', 'blue', 'white')):
+            buffer = BytesIO()
+            PILImage.new('RGB', (50, 50), colour).save(buffer, 'PNG')
+            uploads.append(SimpleUploadedFile(f'shot{i}.png', buffer.getvalue(), content_type='image/png'))
+        payload = {
+            'name': 'Desk', 'description': 'Oak', 'price': '120.00', 'images': uploads,
+        }
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('product-create'), payload, format='multipart')
+        self.assertEqual(response.status_code, 201, response.data)
+
+        images = ProductImage.objects.filter(product_id=response.data['id'])
+        self.assertEqual(images.count(), 4)
+        self.assertEqual(len({image.image.name for image in images}), 4)
+        for image in images:
+            self.assertTrue(image.image.storage.exists(image.image.name))
+        # One derivative job queued per image.
+        self.assertGreaterEqual(len(callbacks), 4)
+
+    def test_backfill_command_processes_missing_images(self):
+        images = [self.make_image((300, 300)) for _ in range(3)]
+        call_command('generate_image_derivatives', workers=2, stdout=StringIO())
+        for image in images:
+            image.refresh_from_db()
+            self.assertTrue(derivatives.is_current(image))
+
+
+class ContentAddressedStorageTests(TemporaryMediaMixin, QueryBudgetTestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Vase', description='', price=Decimal('12.00'), condition='new', sku='VASE-1',
+        )
+        buffer = BytesIO()
+        PILImage.new('RGB', (300, 300), 'purple').save(buffer, 'JPEG')
+        self.data = buffer.getvalue()
+
+    def make_image(self, filename='vase.jpg'):
+        return ProductImage.objects.create(
+            product=self.product, image=SimpleUploadedFile(filename, self.data),
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.make_image('front.jpg')
+        storage = first.image.storage
+        with mock.patch('django.core.files.storage.FileSystemStorage._save') as write:
+            second = self.make_image('FRONT-copy.JPG')
+        write.assert_not_called()
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^products/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertTrue(storage.exists(first.image.name))
+
+    def test_file_is_deleted_with_its_last_reference(self):
+        first, second = self.make_image(), self.make_image()
+        derivatives.generate(first)
+        derivatives.generate(second)
+        self.assertEqual(first.derivatives, second.derivatives)
+        storage = first.image.storage
+        files = list(first.derivatives.values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        for name in files:
+            self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        for name in files:
+            self.assertFalse(storage.exists(name))
+
+    def test_upload_racing_the_last_delete_keeps_its_file(self):
+        first = self.make_image()
+        storage = first.image.storage
+        save = ContentAddressedStorage.save_derived
+        raced = []
+
+        def last_reference_released_meanwhile(storage, name, content):
+            # The write is skipped as the file exists, then the only other
+            # image goes before this upload's row is in.
+            saved = save(storage, name, content)
+            if not raced:
+                raced.append(name)
+                with self.captureOnCommitCallbacks(execute=True):
+                    first.delete()
+                self.assertFalse(storage.exists(name))
+            return saved
+
+        with mock.patch.object(ContentAddressedStorage, 'save_derived', last_reference_released_meanwhile):
+            second = self.make_image()
+        self.assertEqual(raced, [second.image.name])
+        self.assertTrue(storage.exists(second.image.name))
+        self.assertEqual(StoredImage.objects.get(name=second.image.name).references, 1)
+
+    def test_spooled_upload_deleted_after_its_move_is_written_again(self):
+        upload = TemporaryUploadedFile('vase.jpg', 'image/jpeg', len(self.data), None)
+        self.addCleanup(upload.close)
+        upload.write(self.data)
+        upload.seek(0)
+        save = ContentAddressedStorage.save_derived
+        raced = []
+
+        def discarded_by_a_failed_duplicate(storage, name, content):
+            # The temporary file is moved into place, then another upload of
+            # the same content fails and discards it before this row is in.
+            saved = save(storage, name, content)
+            if not raced:
+                raced.append(saved)
+                derivatives.discard([saved], storage)
+                self.assertFalse(storage.exists(saved))
+            return saved
+
+        with mock.patch.object(ContentAddressedStorage, 'save_derived', discarded_by_a_failed_duplicate):
+            image = ProductImage.objects.create(product=self.product, image=upload)
+        self.assertEqual(raced, [image.image.name])
+        with image.image.storage.open(image.image.name, 'rb') as stored:
+            self.assertEqual(stored.read(), self.data)
+        self.assertEqual(StoredImage.objects.get(name=image.image.name).references, 1)
+
+    def test_duplicate_reuses_existing_derivatives(self):
+        first = self.make_image()
+        derivatives.generate(first)
+        second = self.make_image()
+        with mock.patch('products.imaging.render_variants') as render:
+            derivatives.schedule(second.pk)
+        render.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.derivatives, first.derivatives)
+
+
+class RelatedProductsTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='related', password='x')
+        self.client.force_authenticate(self.user)
+        self.kitchen = Category.objects.create(name='Kitchen', slug='kitchen')
+        self.garden = Category.objects.create(name='Garden', slug='garden')
+        steel, copper, outdoor = (Tag.objects.create(name=name) for name in ('steel', 'copper', 'outdoor'))
+        self.pan = self.product('Pan', self.kitchen, [steel, copper])
+        self.pot = self.product('Pot', self.kitchen, [steel, copper])
+        self.kettle = self.product('Kettle', self.kitchen, [steel])
+        self.hose = self.product('Hose', self.garden, [outdoor])
+        self.trowel = self.product('Trowel', self.garden, [outdoor, steel])
+
+    def product(self, name, category, tags):
+        product = Product.objects.create(
+            name=name, description='', price=Decimal('10.00'), category=category, condition='new', sku=name.upper(),
+        )
+        product.tags.set(tags)
+        return product
+
+    def related_ids(self, product):
+        return list(
+            RelatedProduct.objects.filter(product=product).order_by('rank').values_list('related_id', flat=True)
+        )
+
+    def test_rebuild_ranks_by_shared_tags_and_category(self):
+        related.rebuild()
+        self.assertEqual(self.related_ids(self.pan), [self.pot.pk, self.kettle.pk, self.trowel.pk])
+        self.assertEqual(self.related_ids(self.hose), [self.trowel.pk])
+
+        url = reverse('product-related', kwargs={'id': self.pan.pk})
+        response = self.assertWithinQueryBudget(RelatedProductsAPIView, url)
+        self.assertEqual([item['name'] for item in response.data], ['Pot', 'Kettle', 'Trowel'])
+        self.assertEqual(len(self.client.get(url, {'limit': 1}).data), 1)
+        self.assertEqual(len(self.client.get(url, {'limit': -1}).data), 1)
+
+    def test_tag_changes_update_affected_rows(self):
+        related.rebuild()
+        self.assertFalse(RelatedProductQueue.objects.exists())
+        self.hose.tags.add(Tag.objects.get(name='copper'))
+        self.assertTrue(RelatedProductQueue.objects.filter(product=self.hose).exists())
+
+        call_command('update_related_products', stdout=StringIO())
+        self.assertIn(self.hose.pk, self.related_ids(self.pan))
+        self.assertIn(self.pan.pk, self.related_ids(self.hose))
+        self.assertFalse(RelatedProductQueue.objects.exists())
+
+        self.pot.is_active = False
+        self.pot.save()
+        related.update_stale()
+        self.assertEqual(self.related_ids(self.pot), [])
+        self.assertNotIn(self.pot.pk, self.related_ids(self.pan))
+
+    def test_products_queued_again_during_an_update_stay_queued(self):
+        related.rebuild()
+        related.mark_stale([self.hose.pk])
+        compute = related.compute
+
+        def tag_change_lands_midway(*args, **kwargs):
+            related.mark_stale([self.hose.pk])
+            return compute(*args, **kwargs)
+
+        with mock.patch('products.related.compute', tag_change_lands_midway):
+            related.update_stale()
+        self.assertTrue(RelatedProductQueue.objects.filter(product=self.hose).exists())
+
+        with mock.patch('products.related.compute', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                related.update_stale()
+        self.assertTrue(RelatedProductQueue.objects.filter(product=self.hose).exists())
+
+
+class ProductLookupTests(QueryBudgetTestCase):
+    def setUp(self):
+        lookup.clear()
+        self.user = get_user_model().objects.create_user(username='till', password='x')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('product-lookup')
+        self.mug = Product.objects.create(
+            name='Mug', description='', price=Decimal('4.50'), condition='new', sku='MUG-1',
+        )
+        self.cup = Product.objects.create(
+            name='Cup', description='', price=Decimal('3.00'), condition='new', sku='CUP-1',
+        )
+        Inventory.objects.create(product=self.mug, quantity=7)
+
+    def scan(self, skus):
+        return self.assertWithinQueryBudget(
+            ProductLookupAPIView, self.url, method='post', data={'skus': skus}, format='json',
+        )
+
+    def test_resolves_skus_in_request_order(self):
+        response = self.scan(['CUP-1', 'NOPE', 'MUG-1', 'CUP-1'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['sku'] for item in response.data['results']], ['CUP-1', 'MUG-1'])
+        self.assertEqual(response.data['missing'], ['NOPE'])
+        mug = response.data['results'][1]
+        self.assertEqual((mug['price'], mug['quantity'], mug['image']), ('4.50', 7, None))
+        self.assertEqual(response.data['results'][0]['quantity'], 0)
+
+    def test_hot_skus_are_served_from_lru_until_changed(self):
+        self.scan(['MUG-1'])
+        self.scan(['MUG-1'])
+        with self.assertNumQueries(0):
+            self.assertEqual(set(lookup.lookup(['MUG-1'])), {'MUG-1'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            inventory = self.mug.inventory
+            inventory.quantity = 2
+            inventory.save()
+        self.assertEqual(self.scan(['MUG-1']).data['results'][0]['quantity'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mug.price = Decimal('5.00')
+            self.mug.save()
+        self.assertEqual(self.scan(['MUG-1']).data['results'][0]['price'], '5.00')
+
+    def test_rejects_oversized_batches(self):
+        skus = [f'SKU-{i}' for i in range(lookup.MAX_SKUS + 1)]
+        self.assertEqual(self.client.post(self.url, {'skus': skus}, format='json').status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'skus': []}, format='json').status_code, 400)
+
+
+@mock.patch.object(changes, 'SETTLE_TIME', timedelta(0))
+class ProductChangesTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='replica', password='x')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('product-changes')
+        self.products = [
+            Product.objects.create(
+                name=f'Item {i}', description='', price=Decimal('2.00'), condition='new', sku=f'IT-{i}',
+            )
+            for i in range(5)
+        ]
+
+    def sync(self, since=None, limit=None):
+        params = {key: value for key, value in (('since', since), ('limit', limit)) if value is not None}
+        response = self.assertWithinQueryBudget(ProductChangesAPIView, self.url, data=params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_initial_sync_pages_then_returns_only_changes(self):
+        first = self.sync(limit=3)
+        self.assertTrue(first['has_more'])
+        second = self.sync(first['cursor'], limit=3)
+        self.assertFalse(second['has_more'])
+        synced = [row['id'] for row in first['changed'] + second['changed']]
+        self.assertEqual(synced, [product.pk for product in self.products])
+        self.assertEqual(self.sync(second['cursor'])['changed'], [])
+
+        cheap, gone, hidden = self.products[:3]
+        gone_pk = gone.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.price = Decimal('1.50')
+            cheap.save()
+            Inventory.objects.create(product=self.products[4], quantity=9)
+            gone.delete()
+            hidden.is_active = False
+            hidden.save()
+        delta = self.sync(second['cursor'])
+        self.assertEqual(
+            [(row['id'], row['price'], row['quantity']) for row in delta['changed']],
+            [(cheap.pk, '1.50', 0), (self.products[4].pk, '2.00', 9)],
+        )
+        self.assertEqual(sorted(delta['deleted']), sorted([gone_pk, hidden.pk]))
+        self.assertEqual(self.sync(delta['cursor'])['changed'], [])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get(self.url, {'since': 'garbage'}).status_code, 400)
+        stale = changes.encode_cursor(None, (timezone.now() - timedelta(days=90), 0))
+        self.assertEqual(self.client.get(self.url, {'since': stale}).status_code, 410)
+
+
+class ProductPopularityTests(QueryBudgetTestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='browser', password='x')
+        self.client.force_authenticate(self.user)
+        self.quiet, self.steady, self.hot = (
+            Product.objects.create(
+                name=name, description='', price=Decimal('1.00'), condition='new', sku=name.upper(),
+            )
+            for name in ('Quiet', 'Steady', 'Hot')
+        )
+        # Detail views in other tests leave counts pending in this process.
+        popularity._pending.clear()
+
+    def view(self, product, times):
+        for _ in range(times):
+            self.client.get(reverse('product-detail', kwargs={'id': product.pk}))
+
+    def ordered(self, ordering):
+        response = self.assertWithinQueryBudget(
+            ProductListAPIView, reverse('product-list'), data={'ordering': ordering},
+        )
+        return [item['name'] for item in response.data['results']]
+
+    def test_views_are_buffered_then_flushed_in_one_write(self):
+        self.assertEqual(ProductStats.objects.count(), 3)
+        self.view(self.hot, 3)
+        self.view(self.steady, 1)
+        self.assertEqual(ProductStats.objects.get(product=self.hot).views, 0)
+        with self.assertNumQueries(3):  # savepoint, executemany, release
+            self.assertEqual(popularity.flush(), 2)
+        self.assertEqual(ProductStats.objects.get(product=self.hot).views, 3)
+        self.assertEqual(self.ordered('-views'), ['Hot', 'Steady', 'Quiet'])
+
+    def test_recent_views_outweigh_older_ones(self):
+        with mock.patch.object(popularity, 'weight', return_value=1.0):
+            self.view(self.steady, 4)
+            popularity.flush()
+        with mock.patch.object(popularity, 'weight', return_value=2.0 ** 4):
+            self.view(self.hot, 1)
+            popularity.flush()
+        self.assertEqual(self.ordered('-popularity'), ['Hot', 'Steady', 'Quiet'])
+        self.assertEqual(self.ordered('-views'), ['Steady', 'Hot', 'Quiet'])
+
+    def test_every_ordering_term_applies(self):
+        Product.objects.filter(pk=self.hot.pk).update(price=Decimal('3.00'))
+        self.view(self.steady, 2)
+        popularity.flush()
+        self.assertEqual(self.ordered('-views,-price'), ['Steady', 'Hot', 'Quiet'])
+        self.assertEqual(self.ordered('price,-views'), ['Steady', 'Quiet', 'Hot'])
+
+    def test_each_process_starts_its_own_flusher(self):
+        with mock.patch.object(popularity, '_interval', 5), \
+                mock.patch.object(popularity, '_flusher_pid', None), \
+                mock.patch.object(popularity.threading, 'Thread') as thread, \
+                mock.patch.object(popularity.atexit, 'register'):
+            popularity.record_view(self.hot.pk)
+            popularity.record_view(self.hot.pk)
+            self.assertEqual(thread.call_count, 1)
+            # A forked worker leaves the parent's pending counts to it.
+            with mock.patch.object(popularity.os, 'getpid', return_value=-1):
+                popularity.record_view(self.hot.pk)
+            self.assertEqual(thread.call_count, 2)
+            self.assertEqual(popularity._pending, {self.hot.pk: 1})
+
+    def test_flush_skips_deleted_products(self):
+        self.view(self.quiet, 2)
+        self.view(self.hot, 1)
+        self.quiet.delete()
+        self.assertEqual(popularity.flush(), 2)
+        self.assertEqual(ProductStats.objects.get(product=self.hot).views, 1)
+        self.assertEqual(popularity.flush(), 0)
+
+    def test_flushes_change_the_list_etag(self):
+        url = reverse('product-list')
+        etag = self.client.get(url, {'ordering': 'popularity'})['ETag']
+        self.view(self.hot, 1)
+        popularity.flush()
+        self.assertNotEqual(self.client.get(url, {'ordering': 'popularity'})['ETag'], etag)
@@ -1,11 +1,20 @@
 from django.urls import path
-from .views import ProductListAPIView, ProductDetailAPIView, ProductCreateAPIView, ProductUpdateAPIView, ProductDeleteAPIView
+from .views import ProductListAPIView, ProductDetailAPIView, ProductCreateAPIView, ProductUpdateAPIView, ProductDeleteAPIView, ProductAutocompleteAPIView, ProductFacetsAPIView, CategoryTreeAPIView, ProductImportAPIView, ProductExportAPIView, ProductBulkUpdateAPIView, RelatedProductsAPIView, ProductLookupAPIView, ProductChangesAPIView
 
 urlpatterns = [
     path('products/', ProductListAPIView.as_view(), name='product-list'),
     path('products/<int:id>/', ProductDetailAPIView.as_view(), name='product-detail'),
     path('products/create/', ProductCreateAPIView.as_view(), name='product-create'),
+    path('products/<int:id>/related/', RelatedProductsAPIView.as_view(), name='product-related'),
     path('products/<int:id>/delete/', ProductDeleteAPIView.as_view(), name='product-delete'),
     path('products/<int:id>/update/', ProductUpdateAPIView.as_view(), name='product-update'),
+    path('products/bulk/', ProductBulkUpdateAPIView.as_view(), name='product-bulk-update'),
+    path('products/import/', ProductImportAPIView.as_view(), name='product-import'),
+    path('products/export/', ProductExportAPIView.as_view(), name='product-export'),
+    path('facets/', ProductFacetsAPIView.as_view(), name='product-facets'),
+    path('categories/tree/', CategoryTreeAPIView.as_view(), name='category-tree'),
+    path('changes/', ProductChangesAPIView.as_view(), name='product-changes'),
+    path('lookup/', ProductLookupAPIView.as_view(), name='product-lookup'),
+    path('autocomplete/', ProductAutocompleteAPIView.as_view(), name='product-autocomplete'),
 
 ]
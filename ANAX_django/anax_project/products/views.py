@@ -1,32 +1,97 @@
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
-from rest_framework import generics, filters
-from .models import Product
-from .serializers import ProductSerializer,  ProductCreateSerializer
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import generics
+from core.fieldsets import SparseQuerysetMixin
+from .models import Product, ProductImage, RelatedProduct
+from .serializers import ProductSerializer,  ProductCreateSerializer, ProductBulkUpdateItemSerializer, ProductLookupSerializer
 from .permissions import IsStoreManagerOrAdmin
-from rest_framework.permissions import IsAuthenticated
+from .search import ProductSearchFilter
+from .filters import ProductFilter, ProductOrderingFilter, stats_ordering
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.parsers import MultiPartParser
+from rest_framework import status
+from . import autocomplete, bulk, category_tree, changes, conditional, detail_cache, exporters, facets, importers, lookup, popularity, related, search
 from django_filters.rest_framework import DjangoFilterBackend
 
-class ProductListAPIView(generics.ListAPIView):
-    queryset = Product.objects.all().order_by('-created_at')
+class ProductListAPIView(SparseQuerysetMixin, generics.ListAPIView):
+    queryset = Product.objects.with_relations().order_by('-created_at')
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    query_budget = 4  # products + images + tags, plus fuzzy candidates
+    default_expand = ['images']
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, ProductOrderingFilter]
     
-    # 🔍 Searchable fields
+    # 🔍 Searchable fields (full-text indexed on SQLite, see products.search)
     search_fields = ['name', 'description']
     
-    # 🧪 Filterable fields
-    filterset_fields = {
-        'category': ['exact'],
-        'price': ['gte', 'lte'],
-        'is_active': ['exact'],
-    }
+    # 🧪 Filterable fields (category, price range, is_active, category_tree)
+    filterset_class = ProductFilter
 
+    # Also the ProductStats rankings (popularity, views, best_selling); see
+    # products.filters.STATS_ORDERINGS.
     ordering_fields = ['price', 'created_at']
 
-class ProductDetailAPIView(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    def list(self, request, *args, **kwargs):
+        # The ETag comes from cached versions alone, so a revalidation that
+        # is still current runs no query at all.
+        # View and sales counts move the order without bumping the catalog.
+        etag = conditional.list_validators(
+            request, *([popularity.VERSION_NAME] if stats_ordering(request) else []),
+        )
+        response = conditional.not_modified(request, etag, None)
+        if response is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+            else:
+                response = Response(self.get_serializer(queryset, many=True).data)
+        return conditional.set_validators(response, etag, None)
+
+class ProductFacetsAPIView(ProductListAPIView):
+    """
+    Facet counts for whatever `ProductListAPIView` would return with the same
+    filter and search parameters.
+    """
+    pagination_class = None
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter]
+    query_budget = 2  # fuzzy candidates + one grouped UNION ALL
+
+    def list(self, request, *args, **kwargs):
+        counts = facets.cached_facet_counts(
+            request.query_params,
+            lambda: self.filter_queryset(self.get_queryset()),
+        )
+        return Response(counts)
+
+class ProductDetailAPIView(SparseQuerysetMixin, generics.RetrieveAPIView):
+    """
+    Payloads are cached per product version (see products.detail_cache), so
+    a warm hit only runs the validator lookup and whatever authentication
+    needs; a current If-None-Match / If-Modified-Since gets a 304.
+    """
+    queryset = Product.objects.with_relations()
     serializer_class = ProductSerializer
     lookup_field = 'id'
+    query_budget = 4  # validators + product + images + tags
+    default_expand = ['images']
+
+    def retrieve(self, request, *args, **kwargs):
+        product_id = self.kwargs['id']
+        last_modified = Product.objects.filter(pk=product_id).values_list('updated_at', flat=True).first()
+        if last_modified is None:
+            raise Http404
+        popularity.record_view(product_id)
+        # The cache key changes whenever the payload would.
+        etag = conditional.make_etag('detail', detail_cache.cache_key(product_id, request), request.accepted_media_type)
+        response = conditional.not_modified(request, etag, last_modified)
+        if response is None:
+            build = lambda: dict(super(ProductDetailAPIView, self).retrieve(request, *args, **kwargs).data)
+            response = Response(detail_cache.get_payload(product_id, request, build))
+        return conditional.set_validators(response, etag, last_modified)
 
 class ProductCreateAPIView(generics.CreateAPIView):
     queryset = Product.objects.all()
@@ -37,12 +102,190 @@ class ProductCreateAPIView(generics.CreateAPIView):
 class ProductUpdateAPIView(generics.UpdateAPIView):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
+    default_expand = ['images']
     permission_classes = [IsAuthenticated, IsStoreManagerOrAdmin]
     lookup_field = 'id'
 
+class RelatedProductsAPIView(generics.ListAPIView):
+    """
+    Precomputed neighbours of a product by shared tags and category, best
+    first (see products.related).
+    """
+    serializer_class = ProductSerializer
+    pagination_class = None
+    default_expand = ['images']
+    query_budget = 4  # related ids + products + images + tags
+
+    def get_queryset(self):
+        try:
+            limit = min(int(self.request.query_params.get('limit', related.TOP_N)), related.TOP_N)
+        except ValueError:
+            limit = related.TOP_N
+        ids = list(
+            RelatedProduct.objects.filter(product_id=self.kwargs['id'])
+            .order_by('rank')
+            .values_list('related_id', flat=True)[:max(limit, 1)]
+        )
+        if not ids and not Product.objects.filter(pk=self.kwargs['id']).exists():
+            raise Http404
+        return search.order_by_ids(Product.objects.with_relations().filter(is_active=True), ids)
+
 class ProductDeleteAPIView(generics.DestroyAPIView):
     queryset = Product.objects.all()
     permission_classes = [IsAuthenticated, IsStoreManagerOrAdmin]
     lookup_field = 'id'
 
-    
\ No newline at end of file
+
+class ProductBulkUpdateAPIView(APIView):
+    """
+    PATCH a list of `{id|sku, price, label, is_active}` entries. Everything is
+    applied in one transaction and recorded as a single AuditLog entry.
+    """
+    permission_classes = [IsAuthenticated, IsStoreManagerOrAdmin]
+    max_entries = 20000
+
+    def patch(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of entries.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > self.max_entries:
+            return Response(
+                {'detail': f'At most {self.max_entries} entries per request.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        serializer = ProductBulkUpdateItemSerializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        result = bulk.bulk_update_products(serializer.validated_data, request.user.get_username())
+        return Response(result)
+
+
+class ProductImportAPIView(APIView):
+    """
+    Upload a CSV or JSON-lines catalog as `file` and upsert it by SKU. Large
+    uploads are already spooled to disk by Django, and rows are streamed from
+    there in chunks.
+    """
+    permission_classes = [IsAuthenticated, IsStoreManagerOrAdmin]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ['This field is required.']}, status=status.HTTP_400_BAD_REQUEST)
+        fmt = request.data.get('format') or importers.detect_format(upload.name)
+        if fmt not in ('csv', 'jsonl'):
+            return Response({'format': ['Must be csv or jsonl.']}, status=status.HTTP_400_BAD_REQUEST)
+        result = importers.import_products(upload, fmt)
+        return Response(result.as_dict())
+
+
+class ProductExportAPIView(APIView):
+    """
+    The full catalog (or a ProductFilter subset) as `?type=ndjson` (default)
+    or `?type=csv`, streamed as rows come off the database cursor.
+    """
+    permission_classes = [IsAuthenticated, IsStoreManagerOrAdmin]
+
+    def get(self, request, *args, **kwargs):
+        fmt = request.query_params.get('type', 'ndjson')
+        if fmt not in exporters.CONTENT_TYPES:
+            return Response({'type': ['Must be csv or ndjson.']}, status=status.HTTP_400_BAD_REQUEST)
+        # Invalid filters are ignored by .qs, which would stream everything.
+        filterset = ProductFilter(request.query_params, queryset=Product.objects.all())
+        if not filterset.is_valid():
+            raise ValidationError(filterset.errors)
+        queryset = filterset.qs
+        response = StreamingHttpResponse(
+            exporters.iter_export(fmt, queryset, build_url=request.build_absolute_uri),
+            content_type=exporters.CONTENT_TYPES[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{fmt}"'
+        return response
+
+
+def absolute_image_urls(request, records):
+    """
+    Copies of compact product records (see products.lookup) with the stored
+    image name swapped for an absolute URL.
+    """
+    storage = ProductImage._meta.get_field('image').storage
+    for record in records:
+        record = dict(record)
+        if record['image']:
+            record['image'] = request.build_absolute_uri(storage.url(record['image']))
+        yield record
+
+
+class ProductLookupAPIView(APIView):
+    """
+    POST `{"skus": [...]}` from a till: price, stock and primary image for
+    each SKU found, in the order asked, plus the SKUs that matched nothing.
+    """
+    query_budget = 1  # one IN query on the sku index, none for LRU hits
+
+    def post(self, request, *args, **kwargs):
+        serializer = ProductLookupSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        skus = serializer.validated_data['skus']
+        found = lookup.lookup(skus)
+        ordered = [found[sku] for sku in dict.fromkeys(skus) if sku in found]
+        return Response({
+            'results': list(absolute_image_urls(request, ordered)),
+            'missing': [sku for sku in dict.fromkeys(skus) if sku not in found],
+        })
+
+
+class ProductChangesAPIView(APIView):
+    """
+    Delta feed for offline catalog replicas: `?since=<cursor>` returns the
+    products changed and the ids removed since that cursor, in batches of
+    `?limit=`, with the cursor to send next (see products.changes).
+    """
+    query_budget = 2  # products + tombstones
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', changes.BATCH_SIZE)), changes.MAX_BATCH_SIZE)
+        except ValueError:
+            limit = changes.BATCH_SIZE
+        try:
+            batch = changes.changes(request.query_params.get('since') or None, max(limit, 1))
+        except changes.ExpiredCursor:
+            return Response(
+                {'detail': 'Cursor has expired; resync from scratch without `since`.'},
+                status=status.HTTP_410_GONE,
+            )
+        except changes.InvalidCursor:
+            raise ValidationError({'since': 'Invalid cursor.'})
+        batch['changed'] = list(absolute_image_urls(request, batch['changed']))
+        return Response(batch)
+
+
+class ProductAutocompleteAPIView(APIView):
+    # Answered entirely from the in-process prefix index: no authentication
+    # lookup and no database query per keystroke.
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    max_limit = 20
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), self.max_limit)
+        except ValueError:
+            limit = 10
+        return Response(autocomplete.lookup(request.query_params.get('q', ''), limit))
+
+
+class CategoryTreeAPIView(APIView):
+    # Public and served from pre-rendered bytes, so skip authentication and
+    # the renderer entirely; clients revalidate with If-None-Match.
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, *args, **kwargs):
+        etag, body = category_tree.get_tree()
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=0, must_revalidate=True)
+        return response